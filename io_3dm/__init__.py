@@ -45,9 +45,9 @@ class Preferences(bpy.types.AddonPreferences):
     def draw(self, context):
         layout = self.layout
         col = layout.column()
-        # col.row().prop(self, "ui_prefs_tab", expand=True)
-        # properties = getattr(self, self.ui_prefs_tab)
-        # MODULES[self.ui_prefs_tab].UI(properties, layout)
+        col.row().prop(self, "ui_prefs_tab", expand=True)
+        properties = getattr(self, self.ui_prefs_tab)
+        MODULES[self.ui_prefs_tab].UI(properties, layout)
         return None
 
 @addon.property
@@ -0,0 +1,173 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Converts 3dm files into .blend files without the user interface.
+
+    blender --background --python io_3dm/batch.py -- "models/*.3dm" --output blends --jobs 8 --report report.json
+
+Runs with the bpy module as well: python io_3dm/batch.py "models/*.3dm" ...
+Every file is imported by its own Blender process, at most --jobs at once.
+--preset takes a JSON object of import options, e.g. {"mesh_faces" : "JOIN"}.
+"""
+import argparse
+import concurrent.futures
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+
+import bpy
+
+PREFIX = "IO3DM"
+MARKER = f"{PREFIX} :: BATCH "
+ADDON = os.path.basename(os.path.dirname(os.path.abspath(__file__)))
+
+def log(message):
+    print(f"{PREFIX} :: {message}", flush=True)
+    return None
+
+def arguments(argv=None):
+    if argv is None:
+        # NOTE: Blender stops parsing at "--", the bpy module leaves argv alone.
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+
+    parser = argparse.ArgumentParser(prog="batch.py", description="Converts 3dm files into .blend files.")
+    parser.add_argument("files", nargs="+", help="3dm files or glob patterns")
+    parser.add_argument("-o", "--output", default="", help="Directory for .blend files, next to each 3dm by default")
+    parser.add_argument("-j", "--jobs", type=int, default=max(1, (os.cpu_count() or 1) // 2), help="Blender processes run at once")
+    parser.add_argument("-p", "--preset", default="", help="JSON file of import options")
+    parser.add_argument("-r", "--report", default="", help="JSON report path, printed when omitted")
+    parser.add_argument("-t", "--timeout", type=float, default=None, help="Seconds a single file may take")
+    parser.add_argument("--compress", action="store_true", help="Compress .blend files")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def expand(patterns):
+    """Returns existing files matching patterns, in order and without
+    duplicates, and the patterns matching no file.
+    """
+    files = {}
+    missing = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        matches = [os.path.abspath(path) for path in matches if os.path.isfile(path)]
+        if not matches:
+            missing.append(pattern)
+        files.update((path, None) for path in matches)
+    return list(files), missing
+
+def destination(path, output):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(os.path.abspath(output) if output else os.path.dirname(path), f"{name}.blend")
+
+def command(path, args):
+    """Returns the command converting a single file in a new process."""
+    script = os.path.abspath(__file__)
+    options = ["--worker", path, "--output", args.output, "--preset", args.preset]
+    if args.compress:
+        options.append("--compress")
+    if bpy.app.binary_path:
+        return [bpy.app.binary_path, "--background", "--python-exit-code", "1", "--python", script, "--", *options]
+    return [sys.executable, script, *options]
+
+def run(path, args):
+    """Converts path in a worker process, returns its record."""
+    start = time.perf_counter()
+    record = {
+        "file" : path,
+        "output" : destination(path, args.output),
+        "status" : "FAILED",
+        "input_bytes" : os.path.getsize(path),
+    }
+    try:
+        process = subprocess.run(command(path, args), capture_output=True, text=True, timeout=args.timeout)
+    except subprocess.TimeoutExpired:
+        record["status"] = "TIMEOUT"
+    else:
+        lines = [line for line in process.stdout.splitlines() if line.startswith(MARKER)]
+        if lines:
+            record.update(json.loads(lines[-1][len(MARKER):]))
+        if process.returncode != 0:
+            record["status"] = "FAILED"
+            errors = process.stderr.strip().splitlines()
+            record["error"] = errors[-1] if errors else f"Exit code {process.returncode}"
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+def convert(path, args):
+    """Worker side, imports path into an empty file and saves it."""
+    import addon_utils
+
+    record = {"status" : "FAILED"}
+    options = {}
+    if args.preset:
+        with open(args.preset) as file:
+            options = json.load(file)
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    bpy.ops.wm.read_homefile(use_empty=True)
+    addon_utils.enable(ADDON, default_set=True)
+
+    start = time.perf_counter()
+    operator = getattr(bpy.ops.import_scene, "3dm")
+    result = operator(
+        filepath = path,
+        name = os.path.splitext(os.path.basename(path))[0],
+        options = options,
+        background = False,
+    )
+    record["import_seconds"] = time.perf_counter() - start
+    record["objects"] = len(bpy.data.objects)
+    record["meshes"] = len(bpy.data.meshes)
+    record["materials"] = len(bpy.data.materials)
+
+    if 'FINISHED' in result:
+        output = destination(path, args.output)
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        start = time.perf_counter()
+        bpy.ops.wm.save_as_mainfile(filepath=output, compress=args.compress)
+        record["save_seconds"] = time.perf_counter() - start
+        record["output_bytes"] = os.path.getsize(output)
+        record["status"] = "FINISHED"
+
+    print(MARKER + json.dumps(record), flush=True)
+    return record
+
+def main(argv=None):
+    args = arguments(argv)
+    if args.worker:
+        record = convert(os.path.abspath(args.files[0]), args)
+        return 0 if record["status"] == "FINISHED" else 1
+
+    files, missing = expand(args.files)
+    for pattern in missing:
+        log(f"MISSING '{pattern}'")
+    jobs = max(1, min(args.jobs, len(files)))
+    log(f"Converting {len(files)} files in {jobs} processes")
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(run, path, args) for path in files]
+        for future in concurrent.futures.as_completed(futures):
+            record = future.result()
+            log(f"{record['status']} '{os.path.basename(record['file'])}' in {record['seconds']:.2f} seconds")
+    # NOTE: Completion order is arbitrary, report in input order.
+    records = [future.result() for future in futures]
+    records.extend({"file" : pattern, "status" : "MISSING"} for pattern in missing)
+
+    report = {
+        "files" : records,
+        "jobs" : jobs,
+        "seconds" : time.perf_counter() - start,
+        "failed" : sum(record["status"] != "FINISHED" for record in records),
+    }
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump(report, file, indent=2)
+        log(f"Report written to '{args.report}'")
+    else:
+        print(json.dumps(report, indent=2), flush=True)
+    return 1 if report["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,17 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 import functools
+import inspect
 import os
+import queue
+import threading
 import time
+import types
 import collections
 import farmhash
 
 import bpy
 import rhino3dm
+from rhino import decode
 
 from io_3dm import utils
 addon = utils.bpy.Addon()
@@ -14,16 +19,28 @@ addon = utils.bpy.Addon()
 MODULES = {
     "properties" : None,
     "converters" : None,
+    "cache" : None,
+    "library" : None,
 }
 MODULES = utils.import_modules(MODULES)
 
 RHINO_INSTANCE_REFERENCE = rhino3dm.ObjectType.InstanceReference
+PIPELINE_DEPTH = 64
 
 def log(message):
     print(f"{addon.name} :: {message}")
     return None
 
 def profile(func):
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            result = yield from func(*args, **kwargs)
+            print(f"{addon.name}" + " >>>>>>> {:.2f} seconds".format(time.time() - start))
+            return result
+        return wrapper
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         start = time.time()
@@ -41,42 +58,109 @@ def timer(func):
         return result
     return wrapper
 
+def run(steps):
+    """Runs an import generator to completion and returns its result."""
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
+
 @timer
 def _import(operator, context):
+    pytables = {}
+    try:
+        return run(import_steps(operator, context, pytables))
+    finally:
+        # NOTE: Workers and shared memory must not outlive a failed import.
+        stop_decode(pytables)
+
+def import_steps(operator, context, pytables):
+    """The import pipeline as a generator.
+
+    Yields the number of objects handled since the last yield, so callers
+    can interleave it with other work. Returns the operator result.
+    """
     print()
     options = operator.options
     options.name = operator.name
     update = operator.update
 
+    pylibrary = library.init(context, operator.filepath, options)
+    if update and (pylibrary is not None or context.scene.collection.children[options.name].library is not None):
+        # NOTE: Libraries are replaced as a whole, linked data can not be reloaded in place.
+        library.unlink(context, options.name)
+        update = False
+    if pylibrary is not None:
+        if library.exists(pylibrary) and not options.force_reload:
+            b3dm = library.load(context, pylibrary)
+            if b3dm is None:
+                operator.report({'ERROR'}, f"Failed to load '{pylibrary['path']}'")
+                return {'CANCELLED'}
+            options.name = b3dm.name
+            return {'FINISHED'}
+        pylibrary["ids"] = snapshot()
+
     try:
         rhfile = load_file(path=operator.filepath)
     except Exception as e:
         operator.report({'ERROR'}, f"Failed to load '{operator.filepath}'")
         return {'CANCELLED'}
+    yield 0
 
     patch_options(options)
 
-    pytables = {}
+    pytables["total"] = 2 * len(rhfile.Objects)
     pytables["collections"] = {}
-    pytables["b3dm"] = init(context, options=options, update=update)
+    pytables["meshes"] = {}
+    pytables["pymeshes"] = {}
+    pytables["b3dm"] = init(context, pytables, options=options, update=update)
 
     options.scale = calculate_scale(context, rhfile)
+    index_file(rhfile, pytables)
+    pytables["cache"] = cache.init(operator.filepath, options)
+    pytables["decode"] = start_decode(operator.filepath, rhfile, pytables, options=options)
 
     if options.filter_cameras and len(rhfile.NamedViews) > 0:
         create_cameras(rhfile.NamedViews, pytables, options=options)
 
     create_materials(rhfile.Materials, pytables, options=options)
+    yield 0
 
     if len(rhfile.Layers) > 0:
         create_layers(rhfile.Layers, pytables, options=options)
+        yield 0
 
     if len(rhfile.Objects) > 0:
-        handle_objects(rhfile, pytables, options=options, update=update)
+        yield from handle_objects(rhfile, pytables, options=options, update=update)
 
     link_to_scene(context, pytables["b3dm"])
     post(pytables)
+
+    if pylibrary is not None and library.write(pylibrary, pytables["b3dm"]) and pylibrary["link"]:
+        # NOTE: Swap the local copy for the shared one, appending would give the same data.
+        rollback(context, pytables, pylibrary["ids"])
+        library.load(context, pylibrary)
     return {'FINISHED'}
 
+def snapshot():
+    """Returns every datablock an import may create."""
+    return {
+        id
+        for datablock in (bpy.data.objects, bpy.data.meshes, bpy.data.curves, bpy.data.cameras, bpy.data.materials, bpy.data.collections, bpy.data.node_groups)
+        for id in datablock
+    }
+
+def rollback(context, pytables, ids):
+    """Removes datablocks created since snapshot ids were taken."""
+    b3dm = pytables.get("b3dm")
+    if b3dm is not None and b3dm in ids and b3dm.name not in context.scene.collection.children:
+        # NOTE: A reloaded project was unlinked from the scene.
+        context.scene.collection.children.link(b3dm)
+        b3dm.use_fake_user = False
+    bpy.data.batch_remove(snapshot() - ids)
+    return None
+
 def patch_options(options):
     env_geometry = vars(converters.geometry)
 
@@ -86,19 +170,38 @@ def patch_options(options):
         env_geometry["RHINO_IMPORT"].pop(rhino3dm.ObjectType.Curve)
 
     if options.mesh_faces == 'JOIN':
-        env_geometry["blmesh_join_maybe"] = env_geometry["blmesh_join_true"]
+        match options.mesh_join_method:
+            case 'GRID':
+                env_geometry["pymesh_join_maybe"] = env_geometry["pymesh_join_true"]
+                env_geometry["blmesh_join_maybe"] = env_geometry["blmesh_join_false"]
+            case 'BMESH':
+                env_geometry["pymesh_join_maybe"] = env_geometry["pymesh_join_false"]
+                env_geometry["blmesh_join_maybe"] = env_geometry["blmesh_join_true"]
 
-        if options.mesh_shading == 'SMOOTH':
-             env_geometry["blmesh_shadesmooth_maybe"] = env_geometry["blmesh_shadesmooth_true"]
-        else:
-             env_geometry["blmesh_shadesmooth_maybe"] = env_geometry["blmesh_shadesmooth_false"]
+        match options.mesh_shading:
+            case 'SMOOTH':
+                env_geometry["mesh_normals_maybe"] = env_geometry["mesh_normals_false"]
+                env_geometry["blmesh_shadesmooth_maybe"] = env_geometry["blmesh_shadesmooth_true"]
+            case 'RHINO':
+                env_geometry["mesh_normals_maybe"] = env_geometry["mesh_normals_true"]
+                env_geometry["blmesh_shadesmooth_maybe"] = env_geometry["blmesh_shadesmooth_rhino"]
+            case _:
+                env_geometry["mesh_normals_maybe"] = env_geometry["mesh_normals_false"]
+                env_geometry["blmesh_shadesmooth_maybe"] = env_geometry["blmesh_shadesmooth_false"]
     else:
+        env_geometry["pymesh_join_maybe"] = env_geometry["pymesh_join_false"]
         env_geometry["blmesh_join_maybe"] = env_geometry["blmesh_join_false"]
+        env_geometry["mesh_normals_maybe"] = env_geometry["mesh_normals_false"]
+        env_geometry["blmesh_shadesmooth_maybe"] = env_geometry["blmesh_shadesmooth_false"]
 
     match options.block_instancing:
         case 'SINGLE_MESH':
             converters.block.definition = converters.block.def_single_mesh
             converters.block.instance = converters.block.ins_single_mesh
+        case 'COLLECTION_INSTANCE' | 'POINT_INSTANCE':
+            # NOTE: Point instancing still uses empties for nested instances.
+            converters.block.definition = converters.block.def_collection_instance
+            converters.block.instance = converters.block.ins_collection_instance
     return None
 
 def set_b3dm_data_index(b3dm):
@@ -122,15 +225,22 @@ def get_b3dm_data(b3dm):
         raise ValueError("CollectionProperty flag 'col_idx':", col_idx)
 
 @profile
-def init(context, options=None, update=None):
+def init(context, pytables, options=None, update=None):
     log("Starting import process")
+    # NOTE: Datablocks the importer may leave behind, the only ones purged.
+    pytables["stale"] = set()
     if update:
         if options.force_reload:
             log("Force reloading.")
         else:
             log("Reloading.")
         b3dm = context.scene.collection.children[options.name]
+        # NOTE: The old project is emptied and purged from here on, rollback
+        ## cannot bring it back, so a reload runs to the end.
+        pytables["committed"] = True
         context.scene.collection.children.unlink(b3dm)
+        pytables["stale"].update(b3dm.all_objects)
+        pytables["stale"].update(b3dm.children_recursive)
         utils.bpy.col.empty(b3dm, recursive=True, objects=True)
     else:
         b3dm = utils.bpy.col.obt(options.name, force=True, overwrite='NEW')
@@ -139,16 +249,18 @@ def init(context, options=None, update=None):
     pr_b3dm = getattr(b3dm, addon.name)
     pr_b3dm.project = True
     b3dm.use_fake_user = True
-
-    if update and options.force_reload:
-        bl_data, bl_temp = get_b3dm_data(b3dm)
-        bl_data.clear()
     return b3dm
 
 @profile
-def purge():
+def purge(pytables):
+    """Removes stale datablocks left without users, instead of scanning the
+    whole file with orphans_purge.
+    """
     log("Purging")
-    bpy.data.orphans_purge(do_recursive=True)
+    count = utils.bpy.purge(utils.bpy.dependencies(pytables["stale"]))
+    # NOTE: Whatever survived is still in use.
+    pytables["stale"] = set()
+    log(f"Removed {count} datablocks")
     return None
 
 @profile
@@ -163,7 +275,17 @@ def post(pytables):
     log("Cleanup")
     for blmat in pytables["materials"]:
         blmat.use_fake_user = False
-    bpy.data.orphans_purge(do_recursive=True)
+    meshes = pytables["meshes"]
+    if len(meshes) > 0:
+        users = sum(blmesh.users for blmesh in meshes.values())
+        log(f"Deduplicated {users - len(meshes)} of {users} meshes")
+    if pytables["cache"] is not None:
+        cache.close(pytables["cache"])
+    stop_decode(pytables)
+    for table, count in pytables["lookups"].items():
+        log(f"Avoided {count} native lookups on {table}")
+    pytables["stale"].update(pytables["materials"])
+    purge(pytables)
     set_b3dm_data_index(pytables["b3dm"])
     return None
 
@@ -179,6 +301,62 @@ def load_file(path=None):
         raise
     return rhfile
 
+@profile
+def index_file(rhfile, pytables):
+    """Indexes objects, definitions and layers by id in one pass.
+
+    Replaces native FindId and FindIndex calls, each crossing into C++.
+    """
+    log("Indexing file")
+    pytables["lookups"] = collections.Counter()
+    pytables["object_ids"] = {rhob.Attributes.Id : rhob for rhob in rhfile.Objects}
+    pytables["definition_ids"] = {rhdef.Id : rhdef for rhdef in rhfile.InstanceDefinitions}
+    pytables["definition_children"] = {rhdef.Id : rhdef.GetObjectIds() for rhdef in pytables["definition_ids"].values()}
+    pytables["layer_ids"] = {rhlay.Id : rhlay.Index for rhlay in rhfile.Layers}
+    pytables["layer_materials"] = {rhlay.Index : rhlay.RenderMaterialIndex for rhlay in rhfile.Layers}
+    return None
+
+def lookup(pytables, table, key, default=None):
+    """Returns pytables[table][key], counting the native lookup it replaces."""
+    pytables["lookups"][table] += 1
+    return pytables[table].get(key, default)
+
+def start_decode(filepath, rhfile, pytables, options=None):
+    """Extracts meshes in worker processes while datablocks are being built.
+
+    Only meshes neither filtered out nor known to the cache are decoded.
+    """
+    workers = addon.preferences.workers
+    if workers < 1:
+        return None
+    indices = [index for index, rhob in enumerate(rhfile.Objects) if needs_pymesh(rhob, pytables, options=options)]
+    if len(indices) == 0:
+        return None
+    rhids = [str(rhfile.Objects[index].Attributes.Id) for index in indices]
+
+    workers = min(workers, len(indices))
+    log(f"Decoding {len(indices)} meshes in {workers} processes")
+    normals = converters.geometry.mesh_normals_maybe is converters.geometry.mesh_normals_true
+    return decode.start(filepath, indices, rhids, options.scale, normals=normals, workers=workers)
+
+def needs_pymesh(rhob, pytables, options=None):
+    """True for meshes to build which the cache can not resolve."""
+    if converters.geometry.RHINO_IMPORT.get(rhob.Geometry.ObjectType) is not converters.geometry.mesh:
+        return False
+    if not filter_object(rhob, options):
+        return False
+    pycache = pytables["cache"]
+    return pycache is None or cache.get_pyid(pycache, str(rhob.Attributes.Id)) is None
+
+def stop_decode(pytables):
+    pydecode = pytables.get("decode")
+    if pydecode is not None:
+        # NOTE: Meshes left unbuilt are of no use anymore.
+        pytables["pymeshes"].clear()
+        decode.close(pydecode)
+        pytables["decode"] = None
+    return None
+
 @profile
 def calculate_scale(context, rhfile):
     log("Calculating unit scale")
@@ -221,14 +399,14 @@ def create_layers(rhlayers, pytables, options=None):
         force=True,
     )
     for rhlay in rhlayers:
-        bllay = create_layer(rhlay, rhlayers, layers, top_layer, options)
+        bllay = create_layer(rhlay, pytables, layers, top_layer, options)
         layers.append(bllay)
     return None
 
-def create_layer(rhlay, rhlayers, layers, top_layer, options=None):
+def create_layer(rhlay, pytables, layers, top_layer, options=None):
     bllay = converters.layer.new(rhlay, name=f"{options.name}::{rhlay.Name}")
 
-    parent_index = rhlayers.FindId(rhlay.ParentLayerId).Index
+    parent_index = lookup(pytables, "layer_ids", rhlay.ParentLayerId, -1)
     parent_bllay = top_layer if parent_index == -1 else layers[parent_index]
 
     if bllay.name not in parent_bllay.children:
@@ -236,194 +414,580 @@ def create_layer(rhlay, rhlayers, layers, top_layer, options=None):
     return bllay
 
 def handle_objects(rhfile, pytables, options=None, update=False):
+    """Generator, yields once per object hashed, restored or built."""
     log("Handling objects")
-    materials = pytables["materials"]
     bl_old, bl_new = get_b3dm_data(pytables["b3dm"])
+    # NOTE: Name lookups on collection properties are linear, work on dicts
+    ## and store the new collection back in bulk.
+    py_old = load_data(bl_old)
+    py_new = {}
 
     new_rhbks = []
     new_rhobs = []
     old_rhob_ids = {}
     old_rhbk_ids = {}
 
-    rhdef_hash = {}
-
-    if options.filter_blocks:
-        for rhdef in rhfile.InstanceDefinitions:
-            rhdef_hash[rhdef.Id] = str(rhdef.GetObjectIds())
+    pytables["pyids"] = {}
+    pytables["definitions"] = {}
+    pytables["geometries"] = {}
 
     # TODO: Optimize for non-reload flow
     if not update or options.force_reload:
         # NOTE: Clear and purge old blobs before importing.
+        pytables["stale"].update(pyitem["blob"] for pyitem in py_old.values())
+        py_old.clear()
         bl_old.clear()
-        purge()
+        purge(pytables)
 
-        for rhob in rhfile.Objects:
-            bl_mat = get_material(rhob, rhfile, materials)
-            if rhob.Geometry.ObjectType == RHINO_INSTANCE_REFERENCE:
-                pyid = str(farmhash.FarmHash32(rhob.Geometry.Encode()["data"] + str(rhdef_hash[rhob.Geometry.ParentIdefId]) + bl_mat.name))
-            else:
-                pyid = str(farmhash.FarmHash32(rhob.Geometry.Encode()["data"] + bl_mat.name))
-            rhob.Attributes.SetUserString("pyid", pyid)
-
-            if rhob.Geometry.ObjectType == RHINO_INSTANCE_REFERENCE and options.filter_blocks:
-                new_rhbks.append(rhob)
-            elif not rhob.Attributes.IsInstanceDefinitionObject and options.filter_objects:
-                new_rhobs.append(rhob)
-
-        if len(new_rhobs) > 0:
-            create_objects(new_rhobs, rhfile, pytables, bl_new, options=options)
+        # NOTE: Nothing to match against, build objects as they are extracted.
+        new_rhobs = stream_objects(rhfile, pytables, new_rhbks, options=options)
+        yield from create_objects(new_rhobs, rhfile, pytables, py_new, options=options)
 
         if len(new_rhbks) > 0:
-            create_blocks(new_rhbks, rhfile, pytables, bl_new, options=options)
+            yield from create_blocks(new_rhbks, rhfile, pytables, py_new, options=options)
     else:
-        for rhob in rhfile.Objects:
-            bl_mat = get_material(rhob, rhfile, materials)
-
-            if rhob.Geometry.ObjectType == RHINO_INSTANCE_REFERENCE:
-                rhdef = rhfile.InstanceDefinitions.FindId(rhob.Geometry.ParentIdefId)
-                pyid = str(farmhash.FarmHash32(rhob.Geometry.Encode()["data"] + str(rhdef_hash[rhob.Geometry.ParentIdefId]) + bl_mat.name))
-            else:
-                pyid = str(farmhash.FarmHash32(rhob.Geometry.Encode()["data"] + bl_mat.name))
+        for rhob in pytables["object_ids"].values():
+            yield 1
+            if not filter_object(rhob, options):
+                continue
+            pyid = get_pyid(rhob, rhfile, pytables, options=options)
             rhob.Attributes.SetUserString("pyid", pyid)
 
-            if pyid in bl_old:
+            if pyid in py_old:
+                # NOTE: Geometry extracted for hashing is not needed anymore.
+                pytables["pymeshes"].pop(str(rhob.Attributes.Id), None)
                 if rhob.Geometry.ObjectType == RHINO_INSTANCE_REFERENCE and options.filter_blocks:
                     old_rhbk_ids.update({pyid : rhob})
                 elif not rhob.Attributes.IsInstanceDefinitionObject and options.filter_objects:
                     old_rhob_ids.update({pyid : rhob})
 
-                item = bl_new.add()
-                item.name = pyid
-                item.blob = bl_old[pyid].blob
+                py_new[pyid] = py_old[pyid]
             else:
                 if rhob.Geometry.ObjectType == RHINO_INSTANCE_REFERENCE and options.filter_blocks:
                     new_rhbks.append(rhob)
                 elif not rhob.Attributes.IsInstanceDefinitionObject and options.filter_objects:
                     new_rhobs.append(rhob)
 
+        moved_rhbk_ids = {}
+        if len(new_rhbks) > 0:
+            new_rhbks = match_blocks(new_rhbks, pytables, py_old, py_new, moved_rhbk_ids)
+
+        if len(old_rhob_ids) > 0:
+            yield from restore_objects(old_rhob_ids, pytables, py_new, options=options)
+        if len(old_rhbk_ids) > 0:
+            yield from restore_objects(old_rhbk_ids, pytables, py_new, options=options)
+        if len(moved_rhbk_ids) > 0:
+            yield from move_blocks(moved_rhbk_ids, pytables, py_new, options=options)
+
+        # NOTE: Restored blobs have to be stored before purging, the rest is unused.
+        store_data(bl_new, py_new)
+        pytables["stale"].update(pyitem["blob"] for pyitem in py_old.values())
+        py_old.clear()
         # NOTE: Clear and purge old unused blobs to improve reimport speed.
         bl_old.clear()
-        purge()
+        purge(pytables)
 
-        if len(old_rhob_ids) > 0:
-            restore_objects(old_rhob_ids, pytables, bl_new, options=options)
         if len(new_rhobs) > 0:
-            create_objects(new_rhobs, rhfile, pytables, bl_new, options=options)
-
-        if len(old_rhbk_ids) > 0:
-            restore_objects(old_rhbk_ids, pytables, bl_new, options=options)
+            yield from create_objects(new_rhobs, rhfile, pytables, py_new, options=options)
         if len(new_rhbks) > 0:
-            create_blocks(new_rhbks, rhfile, pytables, bl_new, options=options)
+            yield from create_blocks(new_rhbks, rhfile, pytables, py_new, options=options)
+
+    store_data(bl_new, py_new)
+    return None
+
+def stream_objects(rhfile, pytables, new_rhbks, options=None):
+    """Generator, hashes objects as the producer hands them over.
+
+    Yields None once per object hashed and objects to build right away,
+    blocks are collected in new_rhbks and built once every object is.
+    """
+    for rhob in pipeline(pytables["object_ids"].values(), pytables, options=options):
+        # NOTE: Counted like the hashing loop of a reload, create_objects skips it.
+        yield None
+        if not filter_object(rhob, options):
+            continue
+        pyid = get_pyid(rhob, rhfile, pytables, options=options)
+        rhob.Attributes.SetUserString("pyid", pyid)
+
+        if rhob.Geometry.ObjectType == RHINO_INSTANCE_REFERENCE and options.filter_blocks:
+            new_rhbks.append(rhob)
+        elif not rhob.Attributes.IsInstanceDefinitionObject and options.filter_objects:
+            yield rhob
+    return None
+
+def pipeline(rhobs, pytables, options=None):
+    """Generator, yields rhobs once a producer thread extracted their meshes.
+
+    The bounded queue lets extraction run ahead of datablock creation,
+    time either side spent waiting is logged to tell the bottleneck.
+    """
+    pyqueue = queue.Queue(maxsize=PIPELINE_DEPTH)
+    pystats = {
+        "items" : 0,
+        "depth" : 0,
+        "peak" : 0,
+        "consumer" : 0.0,
+        "producer" : 0.0,
+        "error" : None,
+        "stop" : threading.Event(),
+    }
+    # NOTE: Blender data is not safe to read from the thread, it gets plain copies.
+    pyoptions = types.SimpleNamespace(
+        filter_blocks = options.filter_blocks,
+        filter_objects = options.filter_objects,
+        scale = options.scale,
+    )
+    thread = threading.Thread(target=produce, args=(rhobs, pytables, pyqueue, pystats), kwargs={"options" : pyoptions}, daemon=True)
+    thread.start()
+    try:
+        while True:
+            depth = pyqueue.qsize()
+            start = time.perf_counter()
+            rhob = pyqueue.get()
+            pystats["consumer"] += time.perf_counter() - start
+            if rhob is None:
+                break
+            pystats["items"] += 1
+            pystats["depth"] += depth
+            pystats["peak"] = max(pystats["peak"], depth)
+            yield rhob
+    finally:
+        pystats["stop"].set()
+        # NOTE: A producer blocked on a full queue has to be drained to stop.
+        while thread.is_alive():
+            try:
+                pyqueue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
+
+    if pystats["error"] is not None:
+        raise pystats["error"]
+    items = max(pystats["items"], 1)
+    log(f"Pipeline :: {pystats['items']} objects, queue depth {pystats['depth'] / items:.1f} average {pystats['peak']} peak")
+    log(f"Pipeline :: Builder waited {pystats['consumer']:.2f} seconds, extractor waited {pystats['producer']:.2f} seconds")
+    return None
+
+def produce(rhobs, pytables, pyqueue, pystats, options=None):
+    """Producer thread, extracts meshes ahead of the main thread.
+
+    Hashing stays on the main thread since it reads material names, options
+    only holds the plain values filtering and extraction need.
+    """
+    pymeshes = pytables["pymeshes"]
+    try:
+        for rhob in rhobs:
+            if pystats["stop"].is_set():
+                break
+            rhid = str(rhob.Attributes.Id)
+            if rhid not in pytables["pyids"] and rhid not in pymeshes and needs_pymesh(rhob, pytables, options=options):
+                pymeshes[rhid] = get_pymesh(rhob, pytables, options=options)
+            start = time.perf_counter()
+            pyqueue.put(rhob)
+            pystats["producer"] += time.perf_counter() - start
+    except Exception as e:
+        pystats["error"] = e
+    finally:
+        pyqueue.put(None)
+    return None
 
+def load_data(bl_data):
+    """Returns {pyid : item} of a stored collection, items as plain dicts."""
+    return {item.name : {"blob" : item.blob, "geometry" : item.geometry, "shading" : item.shading} for item in bl_data}
+
+def store_data(bl_data, py_data):
+    """Replaces the entries of bl_data with py_data.
+
+    Values of stored keys may have been reassigned since, and a cancelled
+    reload may have left entries behind, so everything is written again.
+    """
+    bl_data.clear()
+    for pyid, pyitem in py_data.items():
+        item = bl_data.add()
+        item.name = pyid
+        item.blob = pyitem["blob"]
+        item.geometry = pyitem["geometry"]
+        item.shading = pyitem["shading"]
+    return None
+
+def filter_object(rhob, options):
+    if rhob.Geometry.ObjectType == RHINO_INSTANCE_REFERENCE or rhob.Attributes.IsInstanceDefinitionObject:
+        return options.filter_blocks
+    return options.filter_objects
+
+def get_pyid(rhob, rhfile, pytables, options=None):
+    """Hashes raw geometry buffers, material and block definition into a pyid.
+
+    Meshes are extracted here once and kept in pytables["pymeshes"] to be
+    built later, so hashing them is almost free. With the cache enabled an
+    unchanged file resolves pyids from its index without any extraction.
+    """
+    rhid = str(rhob.Attributes.Id)
+    pyids = pytables["pyids"]
+    if rhid in pyids:
+        return pyids[rhid]
+    rhgeo = rhob.Geometry
+    rhtype = rhgeo.ObjectType
+    pycache = pytables["cache"]
+    # NOTE: Instances are hashed anyway to know their geometry apart from their placement.
+    if pycache is not None and rhtype != RHINO_INSTANCE_REFERENCE:
+        pyid = cache.get_pyid(pycache, rhid)
+        if pyid is not None:
+            pyids[rhid] = pyid
+            return pyid
+
+    seed = farmhash.FarmHash64(get_material(rhob, pytables).name)
+
+    if rhtype == RHINO_INSTANCE_REFERENCE:
+        seed = farmhash.FarmHash64WithSeed(get_definition_hash(rhgeo.ParentIdefId, rhfile, pytables, options=options), seed)
+        pytables["geometries"][rhid] = str(seed)
+        pyid = converters.geometry.hash_transform(rhgeo.Xform, seed)
+    elif rhtype not in converters.geometry.RHINO_IMPORT:
+        # NOTE: Never built, no need to look at its geometry.
+        pyid = rhid
+    elif converters.geometry.RHINO_IMPORT[rhtype] is converters.geometry.mesh:
+        pymesh = pytables["pymeshes"].get(rhid)
+        if pymesh is None:
+            pymesh = pytables["pymeshes"][rhid] = get_pymesh(rhob, pytables, options=options)
+        pyid = converters.geometry.hash_mesh(pymesh, seed)
+    else:
+        pyid = converters.geometry.hash_curve(rhgeo, seed)
+
+    pyid = pyids[rhid] = str(pyid)
+    if pycache is not None:
+        cache.set_pyid(pycache, rhid, pyid)
+    return pyid
+
+def get_pymesh(rhob, pytables, options=None):
+    """Returns the pymesh of rhob, decoded by a worker if one got it."""
+    pydecode = pytables["decode"]
+    if pydecode is not None:
+        buffers = decode.fetch(pydecode, str(rhob.Attributes.Id))
+        if buffers is not None:
+            return converters.geometry.mesh_assemble(buffers)
+    return converters.geometry.mesh_pymesh(rhob, options.scale)
+
+def get_definition_hash(rhdef_id, rhfile, pytables, options=None):
+    """Merkle hash of a block definition, folded from its children's pyids.
+
+    Children pyids already cover geometry, material, transforms and nested
+    definitions, so editing anything inside a block changes the hash of
+    every definition above it. Memoized in pytables["definitions"].
+    """
+    hashes = pytables["definitions"]
+    rhdef_rhid = str(rhdef_id)
+    if rhdef_rhid in hashes:
+        return hashes[rhdef_rhid]
+    # NOTE: Guards against definitions referencing themselves.
+    hashes[rhdef_rhid] = rhdef_rhid
+
+    seed = 0
+    for child_rhid in pytables["definition_children"].get(rhdef_id, ()):
+        child_rhob = pytables["object_ids"].get(child_rhid)
+        if child_rhob is None:
+            continue
+        seed = farmhash.FarmHash64WithSeed(get_pyid(child_rhob, rhfile, pytables, options=options), seed)
+    hashes[rhdef_rhid] = str(seed)
+    return hashes[rhdef_rhid]
+
+def match_blocks(rhbks, pytables, py_old, py_new, moved):
+    """Pairs new instances with unclaimed old ones sharing their geometry.
+
+    Instance pyids include the transform, so a moved instance looks new.
+    Old blobs with the same definition and material are reused, only their
+    placement has to be updated. Returns instances left to be built.
+    Nested instances are rebuilt with their definitions and never match.
+    """
+    stale = collections.defaultdict(list)
+    for pyid, pyitem in py_old.items():
+        if pyitem["geometry"] and pyitem["blob"] is not None and pyid not in py_new:
+            stale[pyitem["geometry"]].append(pyitem)
+
+    geometries = pytables["geometries"]
+    rhbks_left = []
+    for rhob in rhbks:
+        if rhob.Attributes.IsInstanceDefinitionObject:
+            rhbks_left.append(rhob)
+            continue
+        geometry = geometries.get(str(rhob.Attributes.Id))
+        blobs = stale.get(geometry)
+        if not blobs:
+            rhbks_left.append(rhob)
+            continue
+        pyid = rhob.Attributes.GetUserString("pyid")
+        moved.update({pyid : rhob})
+        py_new[pyid] = blobs.pop()
+    return rhbks_left
+
+@profile
+def move_blocks(pyids, pytables, py_data, options=None):
+    log("Moving blocks")
+    layers = pytables["layers"]
+
+    blobs = []
+    shaded = set()
+    for pyid, rhob in pyids.items():
+        pyitem = py_data[pyid]
+        blob = pyitem["blob"]
+        if not rhob.Attributes.IsInstanceDefinitionObject:
+            layers[rhob.Attributes.LayerIndex].objects.link(blob)
+        reshade(blob, pyitem, shaded, options=options)
+        blobs.append(blob)
+    utils.bpy.obj.set_matrices(blobs, converters.block.matrices(list(pyids.values()), options.scale))
+    yield len(blobs)
     return None
 
 @profile
-def restore_objects(pyids, pytables, bl_data, options=None):
+def restore_objects(pyids, pytables, py_data, options=None):
     log("Restoring objects")
     layers = pytables["layers"]
 
+    shaded = set()
     for pyid, rhob in pyids.items():
-        item = bl_data[pyid]
-        blob = item.blob
+        yield 1
+        pyitem = py_data[pyid]
+        blob = pyitem["blob"]
         # NOTE: Restored objects have no distinction bettween definitions and instances,
         ## got to skip linking definitions.
         if not rhob.Attributes.IsInstanceDefinitionObject:
             layers[rhob.Attributes.LayerIndex].objects.link(blob)
+        reshade(blob, pyitem, shaded, options=options)
+    return None
 
-        blob.data.set_sharp_from_angle(angle=0.6)
-        match options.mesh_shading:
-            case 'SMOOTH':
-                blob.data.shade_smooth()
-            case 'FLAT':
-                blob.data.shade_flat()
+def reshade(blob, pyitem, shaded, options=None):
+    """Redoes the shading of a reused blob if the option changed.
+
+    Meshes shared by several blobs are only shaded once, shaded collects them.
+    """
+    # NOTE: Collection instances are empties, nothing to shade.
+    if blob.type != 'MESH':
+        return None
+    # NOTE: Shading lives in the mesh, only redo it when the option changed.
+    if pyitem["shading"] == options.mesh_shading:
+        return None
+    pyitem["shading"] = options.mesh_shading
+    if blob.data in shaded:
+        return None
+    shaded.add(blob.data)
+
+    match options.mesh_shading:
+        case 'SMOOTH':
+            blob.data.set_sharp_from_angle(angle=0.6)
+            blob.data.shade_smooth()
+        case 'FLAT':
+            blob.data.set_sharp_from_angle(angle=0.6)
+            blob.data.shade_flat()
+        case 'RHINO':
+            # NOTE: Custom normals are stored in the mesh, nothing to redo.
+            pass
     return None
 
 @profile
-def create_objects(rhobs, rhfile, pytables, bl_data, options=None):
+def create_objects(rhobs, rhfile, pytables, py_data, options=None):
     log("Importing objects")
-    materials = pytables["materials"]
     layers = pytables["layers"]
 
     for rhob in rhobs:
+        yield 1
+        if rhob is None:
+            continue
         if rhob.Geometry.ObjectType in converters.geometry.RHINO_IMPORT:
-
-
-            blob = create_object(rhob, rhfile, materials, bl_data, options=options)
+            blob = create_object(rhob, rhfile, pytables, py_data, options=options)
             if not rhob.Attributes.IsInstanceDefinitionObject:
                 layers[rhob.Attributes.LayerIndex].objects.link(blob)
         else:
             pass
     return None
 
-def create_object(rhob, rhfile, materials, bl_data, options=None, inherited=None):
+def create_object(rhob, rhfile, pytables, py_data, options=None, inherited=None):
     rhob_attrs = rhob.Attributes
     rhid = str(rhob_attrs.Id)
+    pyid = rhob_attrs.GetUserString("pyid")
+    pycache = pytables["cache"]
+
+    blmat = get_material(rhob, pytables, inherited=inherited)
+
+    pymesh = pytables["pymeshes"].pop(rhid, None)
+    cached = False
+    if pycache is not None and converters.geometry.RHINO_IMPORT[rhob.Geometry.ObjectType] is converters.geometry.mesh:
+        if pymesh is None:
+            pymesh = cache.load(pycache, pyid)
+            cached = pymesh is not None
+        if pymesh is None:
+            pymesh = get_pymesh(rhob, pytables, options=options)
+
+    blob = converters.object.new(
+        rhob,
+        options = options,
+        meshes = pytables["meshes"],
+        pymesh = pymesh,
+    )
+    set_material(blob, blmat)
 
-    blmat = get_material(rhob, rhfile, materials, inherited=inherited)
-
-    blob = converters.object.new(rhob, options=options)
-    blob.data.materials.append(blmat)
+    if pymesh is not None and pycache is not None and not cached:
+        # NOTE: Arrays are joined and centered by now, stored as built.
+        cache.save(pycache, pyid, pymesh)
 
-    item = bl_data.add()
-    item.name = rhob_attrs.GetUserString("pyid")
-    item.blob = blob
+    py_data[pyid] = {"blob" : blob, "geometry" : "", "shading" : options.mesh_shading}
     return blob
 
 @profile
-def create_blocks(rhobs, rhfile, pytables, bl_data, options=None):
+def create_blocks(rhobs, rhfile, pytables, py_data, options=None):
     log("Importing blocks")
-    blocks = pytables["blocks"] = {}
-    materials = pytables["materials"]
+    pytables["blocks"] = {}
     layers = pytables["layers"]
 
-    for rhob in rhobs:
-        if rhob.Geometry.ObjectType in converters.geometry.RHINO_IMPORT:
-            blob = create_block(rhob, rhfile, blocks, materials, bl_data, options=options)
-            if not rhob.Attributes.IsInstanceDefinitionObject:
-                layers[rhob.Attributes.LayerIndex].objects.link(blob)
-        else:
-            pass
-    return None
+    # NOTE: Nested instances are built inside their definitions.
+    rhbks = [rhob for rhob in rhobs if not rhob.Attributes.IsInstanceDefinitionObject]
+    order, materials = sort_definitions(rhbks, pytables)
+    for rhdef_id in order:
+        create_definition(rhdef_id, rhfile, pytables, py_data, materials[rhdef_id], options=options)
+        yield 0
+
+    if options.block_instancing == 'POINT_INSTANCE':
+        groups = collections.defaultdict(list)
+        for rhob in rhbks:
+            groups[(str(rhob.Geometry.ParentIdefId), rhob.Attributes.LayerIndex)].append(rhob)
+        for (rhdef_rhid, layer_index), group in groups.items():
+            blob = create_points(group, pytables, options=options)
+            layers[layer_index].objects.link(blob)
+            yield len(group)
+        log(f"Instanced {len(rhbks)} blocks on {len(groups)} objects")
+        return None
 
-def create_block(rhob, rhfile, blocks, materials, bl_data, options=None, inherited=None):
-    blmat = get_material(rhob, rhfile, materials, inherited=inherited)
+    blbks = []
+    for rhob in rhbks:
+        yield 1
+        blob = create_block(rhob, pytables, py_data, options=options)
+        layers[rhob.Attributes.LayerIndex].objects.link(blob)
+        blbks.append(blob)
+    # NOTE: Transforms of all instances are converted and written at once.
+    utils.bpy.obj.set_matrices(blbks, converters.block.matrices(rhbks, options.scale))
+    return None
 
-    rhdef_rhid = str(rhob.Geometry.ParentIdefId)
-    if rhdef_rhid in blocks:
-        bldef = blocks[rhdef_rhid]
-        blbk = converters.block.instance(rhob, bldef, options=options)
-    else:
-        rhdef = rhfile.InstanceDefinitions.FindId(rhob.Geometry.ParentIdefId)
-        children = []
+def sort_definitions(rhbks, pytables):
+    """Walks the definition graph from the references to be built.
+
+    Returns used definitions children first, each with the material its
+    first reference passes down, so every definition is built exactly once
+    and without recursion. Definitions nobody references are skipped.
+    """
+    materials = {}
+    references = collections.Counter()
+    stack = []
+    for rhob in rhbks:
+        rhdef_id = rhob.Geometry.ParentIdefId
+        references[rhdef_id] += 1
+        if rhdef_id not in materials:
+            materials[rhdef_id] = get_material(rhob, pytables)
+            stack.append(rhdef_id)
+
+    # NOTE: Top down, materials are inherited from parents.
+    nested = {}
+    while stack:
+        rhdef_id = stack.pop()
+        nested[rhdef_id] = []
         inherited = {}
-        inherited["material"] = blmat
-        for child_rhid in rhdef.GetObjectIds():
-            if child_rhid in blocks:
-                child_blob = blocks[child_rhid]
-            else:
-                child_rhob = rhfile.Objects.FindId(child_rhid)
-                if child_rhob.Geometry.ObjectType == RHINO_INSTANCE_REFERENCE:
-                    child_blob = create_block(child_rhob, rhfile, blocks, materials, bl_data, options=options, inherited=inherited)
-                elif child_rhob.Geometry.ObjectType in converters.geometry.RHINO_IMPORT:
-                    child_blob = create_object(child_rhob, rhfile, materials, bl_data, options=options, inherited=inherited)
-                else:
-                    continue
-                blocks[child_rhid] = child_blob
-            children.append(child_blob)
-        bldef = blocks[rhdef_rhid] = converters.block.definition(rhdef, children, options=options)
-        blbk = converters.block.instance(rhob, bldef, options=options)
-
-    item = bl_data.add()
-    item.name = rhob.Attributes.GetUserString("pyid")
-    item.blob = blbk
+        inherited["material"] = materials[rhdef_id]
+        for child_rhid in pytables["definition_children"].get(rhdef_id, ()):
+            child_rhob = pytables["object_ids"].get(child_rhid)
+            if child_rhob is None or child_rhob.Geometry.ObjectType != RHINO_INSTANCE_REFERENCE:
+                continue
+            child_rhdef_id = child_rhob.Geometry.ParentIdefId
+            references[child_rhdef_id] += 1
+            nested[rhdef_id].append(child_rhdef_id)
+            if child_rhdef_id not in materials:
+                materials[child_rhdef_id] = get_material(child_rhob, pytables, inherited=inherited)
+                stack.append(child_rhdef_id)
+
+    # NOTE: Bottom up, children are built before their parents.
+    order = []
+    depths = {}
+    for rhdef_id in nested:
+        if rhdef_id in depths:
+            continue
+        depths[rhdef_id] = 0
+        stack = [(rhdef_id, iter(nested[rhdef_id]))]
+        while stack:
+            parent, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                depths[parent] = 1 + max((depths[child] for child in nested[parent]), default=0)
+                order.append(parent)
+            elif child not in depths:
+                depths[child] = 0
+                stack.append((child, iter(nested[child])))
+
+    log(
+        f"{len(order)} of {len(pytables['definition_ids'])} definitions used, "
+        f"{sum(references.values())} references, "
+        f"depth {max(depths.values(), default=0)}"
+    )
+    return order, materials
+
+def create_block(rhob, pytables, py_data, options=None):
+    bldef = pytables["blocks"][str(rhob.Geometry.ParentIdefId)]
+    blbk = converters.block.instance(rhob, bldef, options=options)
+
+    py_data[rhob.Attributes.GetUserString("pyid")] = {
+        "blob" : blbk,
+        "geometry" : pytables["geometries"].get(str(rhob.Attributes.Id), ""),
+        "shading" : options.mesh_shading if blbk.type == 'MESH' else "",
+    }
     return blbk
 
-def get_material(rhob, rhfile, materials, inherited=None):
+def create_points(rhbks, pytables, options=None):
+    """Instances one definition on a single carrier object, a point per reference."""
+    bldef = pytables["blocks"][str(rhbks[0].Geometry.ParentIdefId)]
+    return converters.block.ins_points(rhbks, bldef, name=f"{bldef.name}::Points", options=options)
+
+def create_definition(rhdef_id, rhfile, pytables, py_data, blmat, options=None):
+    """Builds a definition whose nested definitions are already built."""
+    rhdef = lookup(pytables, "definition_ids", rhdef_id)
+    children = []
+    child_rhbks = []
+    child_blbks = []
+    inherited = {}
+    inherited["material"] = blmat
+    for child_rhid in pytables["definition_children"][rhdef_id]:
+        child_rhob = lookup(pytables, "object_ids", child_rhid)
+        if child_rhob is None:
+            continue
+        if child_rhob.Geometry.ObjectType == RHINO_INSTANCE_REFERENCE:
+            child_blob = create_block(child_rhob, pytables, py_data, options=options)
+            child_rhbks.append(child_rhob)
+            child_blbks.append(child_blob)
+        elif child_rhob.Geometry.ObjectType in converters.geometry.RHINO_IMPORT:
+            child_blob = create_object(child_rhob, rhfile, pytables, py_data, options=options, inherited=inherited)
+        else:
+            continue
+        children.append(child_blob)
+    # NOTE: Nested instances are placed before joining the definition.
+    utils.bpy.obj.set_matrices(child_blbks, converters.block.matrices(child_rhbks, options.scale))
+    bldef = pytables["blocks"][str(rhdef_id)] = converters.block.definition(rhdef, children, options=options)
+    # NOTE: Purged once nothing instances it anymore, an unlinked single mesh right away.
+    pytables["stale"].add(bldef)
+    return bldef
+
+def set_material(blob, blmat):
+    bldata = blob.data
+    if len(bldata.materials) == 0:
+        bldata.materials.append(blmat)
+    elif bldata.materials[0] != blmat:
+        # NOTE: Data is shared with an object using another material.
+        slot = blob.material_slots[0]
+        slot.link = 'OBJECT'
+        slot.material = blmat
+    return None
+
+def get_material(rhob, pytables, inherited=None):
+    materials = pytables["materials"]
     match rhob.Attributes.MaterialSource:
         case rhino3dm.ObjectMaterialSource.MaterialFromObject:
             blmat = materials[rhob.Attributes.MaterialIndex]
         case rhino3dm.ObjectMaterialSource.MaterialFromLayer:
-            blmat = materials[rhfile.Layers.FindIndex(rhob.Attributes.LayerIndex).RenderMaterialIndex]
+            blmat = materials[lookup(pytables, "layer_materials", rhob.Attributes.LayerIndex, -1)]
         case rhino3dm.ObjectMaterialSource.MaterialFromParent:
             if inherited:
                 blmat = inherited["material"]
@@ -470,6 +1034,15 @@ class IO3DM_ImportOptions(bpy.types.PropertyGroup):
         default = 'JOIN',
     )
 
+    mesh_join_method : bpy.props.EnumProperty(
+        name = "Method",
+        items = [
+            ('GRID', "Grid", ""),
+            ('BMESH', "BMesh", ""),
+        ],
+        default = 'GRID',
+    )
+
     mesh_join_threshold : bpy.props.FloatProperty(
         name = "Threshold",
         default = 0.001,
@@ -483,6 +1056,7 @@ class IO3DM_ImportOptions(bpy.types.PropertyGroup):
         items = [
             ('FLAT', "Flat", ""),
             ('SMOOTH', "Smooth", ""),
+            ('RHINO', "Rhino", ""),
         ],
         default = 'SMOOTH',
     )
@@ -490,9 +1064,12 @@ class IO3DM_ImportOptions(bpy.types.PropertyGroup):
     block_instancing : bpy.props.EnumProperty(
         name = "Instancing",
         items = [
-            # ('COLLECTION_INSTANCE',"Collection Instance",""),
+            ('COLLECTION_INSTANCE',"Collection Instance",""),
             ('SINGLE_MESH',"Single Mesh", ""),
-        ],
+        ] + ([
+            # NOTE: Matrix attributes and Set Instance Transform need 4.2.
+            ('POINT_INSTANCE',"Point Instance", ""),
+        ] if bpy.app.version >= (4, 2, 0) else []),
         default = 'SINGLE_MESH',
     )
 
@@ -506,11 +1083,30 @@ class IO3DM_ImportOptions(bpy.types.PropertyGroup):
         default = 'BOTH',
     )
 
+    library : bpy.props.EnumProperty(
+        name = "Library",
+        items = [
+            ('NONE', "None", "Convert into this file"),
+            ('LINK', "Link", "Convert once into a .blend next to the 3dm file and link it"),
+            ('APPEND', "Append", "Convert once into a .blend next to the 3dm file and append it"),
+        ],
+        default = 'NONE',
+    )
+
 class IO3DM_OT_Import(bpy.types.Operator):
     bl_idname = "import_scene.3dm"
     bl_label = "Import 3DM"
     bl_options = {'REGISTER', 'UNDO'}
 
+    # NOTE: Events that only move the view, anything else may change data
+    ## a running background import still holds.
+    PASS_THROUGH = {'MOUSEMOVE', 'INBETWEEN_MOUSEMOVE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE', 'MIDDLEMOUSE', 'TRACKPADPAN', 'TRACKPADZOOM', 'MOUSEROTATE'}
+    running = False
+
+    @classmethod
+    def poll(cls, context):
+        return not cls.running
+
     def enum_get_loaded(self, context):
         return [(blcol.name, blcol.name, '') for blcol in context.scene.collection.children if "project" in getattr(blcol, addon.name)]
 
@@ -546,11 +1142,76 @@ class IO3DM_OT_Import(bpy.types.Operator):
         default = False,
     )
 
+    background : bpy.props.BoolProperty(
+        name = "Background",
+        default = False,
+    )
+
     def execute(self, context):
         session = addon.session
         session.filepath = self.filepath
         self.update = True if self.name in self.get_loaded(context) else False
-        return _import(self, context)
+        if not self.background:
+            return _import(self, context)
+
+        # NOTE: Runs the pipeline in time slices from a timer, ESC cancels.
+        wm = context.window_manager
+        self._ids = snapshot()
+        self._pytables = {}
+        self._steps = import_steps(self, context, self._pytables)
+        self._done = 0
+        self._start = time.time()
+        self._timer = wm.event_timer_add(0.01, window=context.window)
+        wm.progress_begin(0, 100)
+        wm.modal_handler_add(self)
+        IO3DM_OT_Import.running = True
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC' and not self._pytables.get("committed"):
+            self.cancel(context)
+            log("Cancelled")
+            return {'CANCELLED'}
+        if event.type in self.PASS_THROUGH:
+            return {'PASS_THROUGH'}
+        if event.type != 'TIMER':
+            # NOTE: Swallowed, undo or another import would pull data from under the pipeline.
+            return {'RUNNING_MODAL'}
+
+        deadline = time.time() + 0.02
+        try:
+            while time.time() < deadline:
+                self._done += next(self._steps)
+        except StopIteration as stop:
+            self.finish(context)
+            log("Finished in {:.2f} seconds\n".format(time.time() - self._start))
+            return stop.value
+        except Exception as e:
+            self.cancel(context)
+            self.report({'ERROR'}, f"Failed to import '{self.filepath}': {e}")
+            return {'CANCELLED'}
+
+        total = max(self._pytables.get("total", 0), 1)
+        rate = self._done / max(time.time() - self._start, 1e-3)
+        context.window_manager.progress_update(min(100.0 * self._done / total, 100.0))
+        hint = "reloading, cannot cancel" if self._pytables.get("committed") else "ESC to cancel"
+        context.workspace.status_text_set(f"Importing '{self.name}' :: {self._done}/{total} objects, {rate:.0f} objects/s, {hint}")
+        return {'RUNNING_MODAL'}
+
+    def finish(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+        IO3DM_OT_Import.running = False
+        return None
+
+    def cancel(self, context):
+        self.finish(context)
+        self._steps.close()
+        stop_decode(self._pytables)
+        rollback(context, self._pytables, self._ids)
+        return None
 
     def draw(self, context):
         layout = self.layout
@@ -572,6 +1233,8 @@ class IO3DM_OT_Import(bpy.types.Operator):
 
         col.prop(self, "name")
         col.prop(options, "force_reload", toggle=True)
+        col.prop(self, "background")
+        col.prop(options, "library")
 
         col =  layout.box().column()
         col.use_property_split = True
@@ -599,6 +1262,7 @@ class IO3DM_OT_Import(bpy.types.Operator):
         sub = col.column(align=True)
         sub.enabled = (options.mesh_faces == 'JOIN')
         sub.row(align=True).prop(options, "mesh_shading", expand=True)
+        sub.prop(options, "mesh_join_method")
         sub.prop(options, "mesh_join_threshold")
 
         sub = col.column()
@@ -623,6 +1287,26 @@ def IO3DM_BT_Import(self, context):
     self.layout.operator(IO3DM_OT_Import.bl_idname, text="Rhino3D (.3dm)")
     return None
 
+def UI(preferences, layout):
+    col = layout.box().column()
+    col.use_property_split = True
+    col.use_property_decorate = False
+    col.label(text="Decoding")
+    col.prop(preferences, "workers")
+
+    cache.UI(preferences.cache, layout)
+    return None
+
+@addon.property
+class Preferences_Import(bpy.types.PropertyGroup):
+    workers : bpy.props.IntProperty(
+        name = "Workers",
+        description = "Processes extracting meshes next to Blender, 0 extracts them in Blender",
+        default = 0,
+        min = 0,
+        max = os.cpu_count() or 1,
+    )
+
 @addon.property
 class WindowManager_Import(bpy.types.PropertyGroup):
     filepath : bpy.props.StringProperty(
@@ -632,6 +1316,7 @@ class WindowManager_Import(bpy.types.PropertyGroup):
 CLASSES = [
     IO3DM_ImportOptions,
     IO3DM_OT_Import,
+    Preferences_Import,
     WindowManager_Import,
 ]
 
@@ -0,0 +1,200 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+import json
+import mmap
+import os
+import shutil
+
+import bpy
+import farmhash
+import numpy
+
+from io_3dm import utils
+addon = utils.bpy.Addon()
+
+def log(message):
+    print(f"{addon.name} :: Cache :: {message}")
+    return None
+
+def init(filepath, options):
+    """Returns the cache state for one import, None if disabled.
+
+    Mesh entries live in `meshes/<signature>/<pyid>/` as one .npy file per
+    array. The signature covers every option that changes pyids or the
+    stored arrays. `index/<file>.json` maps object ids to pyids for a given
+    file content, so an unchanged file is resolved without any extraction.
+    """
+    preferences = addon.preferences
+    if not preferences.use_cache:
+        return None
+
+    if preferences.directory:
+        directory = bpy.path.abspath(preferences.directory)
+    else:
+        directory = bpy.utils.user_resource('DATAFILES', path=f"{addon.name}_cache", create=True)
+
+    signature = farmhash.FarmHash64(repr((
+        options.scale,
+        options.mesh_faces,
+        options.mesh_join_method,
+        options.mesh_join_threshold,
+        options.mesh_shading,
+        options.filter_mesh_curves,
+    )))
+
+    key = digest(filepath, signature)
+    if key is None:
+        return None
+
+    pycache = {
+        "directory" : directory,
+        "meshes" : os.path.join(directory, "meshes", str(signature)),
+        "index" : os.path.join(directory, "index", f"{key}.json"),
+        "limit" : preferences.size * 1024 * 1024,
+        "pyids" : {},
+        "dirty" : False,
+        "hits" : 0,
+        "misses" : 0,
+    }
+
+    try:
+        with open(pycache["index"], "r") as file:
+            pycache["pyids"] = json.load(file)
+    except (OSError, ValueError):
+        pass
+    return pycache
+
+def digest(filepath, seed=0):
+    """Hashes the content of filepath, None if it can not be read."""
+    try:
+        with open(filepath, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return farmhash.FarmHash64WithSeed(data, seed)
+    except (OSError, ValueError):
+        log(f"Failed to read '{filepath}'")
+        return None
+
+def get_pyid(pycache, rhid):
+    return pycache["pyids"].get(rhid)
+
+def set_pyid(pycache, rhid, pyid):
+    if pycache["pyids"].get(rhid) != pyid:
+        pycache["pyids"][rhid] = pyid
+        pycache["dirty"] = True
+    return None
+
+def load(pycache, pyid):
+    """Returns memory-mapped arrays stored for pyid, None on a miss."""
+    path = os.path.join(pycache["meshes"], pyid)
+    try:
+        pymesh = {
+            entry.name[:-4] : numpy.load(entry.path, mmap_mode='r')
+            for entry in os.scandir(path) if entry.name.endswith(".npy")
+        }
+        # NOTE: Modification time of the entry is its last use.
+        os.utime(path)
+    except (OSError, ValueError):
+        pycache["misses"] += 1
+        return None
+    pycache["hits"] += 1
+    return pymesh
+
+def save(pycache, pyid, pymesh):
+    path = os.path.join(pycache["meshes"], pyid)
+    if os.path.isdir(path):
+        return None
+    temp = f"{path}.tmp"
+    try:
+        os.makedirs(temp, exist_ok=True)
+        for name, array in pymesh.items():
+            numpy.save(os.path.join(temp, f"{name}.npy"), numpy.asarray(array))
+        os.replace(temp, path)
+    except OSError:
+        shutil.rmtree(temp, ignore_errors=True)
+        log(f"Failed to store '{pyid}'")
+    return None
+
+def close(pycache):
+    log(f"{pycache['hits']} hits, {pycache['misses']} misses")
+    if pycache["dirty"]:
+        try:
+            os.makedirs(os.path.dirname(pycache["index"]), exist_ok=True)
+            with open(pycache["index"], "w") as file:
+                json.dump(pycache["pyids"], file)
+        except OSError:
+            log("Failed to store index")
+    try:
+        evict(pycache)
+    except OSError:
+        log("Failed to evict entries")
+    return None
+
+def evict(pycache):
+    """Removes least recently used entries until the cache fits its limit."""
+    entries = []
+    for path in scan(os.path.join(pycache["directory"], "meshes")):
+        for entry in scan(path):
+            if not entry.endswith(".tmp"):
+                size = sum(os.path.getsize(file) for file in scan(entry))
+                entries.append((os.path.getmtime(entry), size, entry))
+    for entry in scan(os.path.join(pycache["directory"], "index")):
+        entries.append((os.path.getmtime(entry), os.path.getsize(entry), entry))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= pycache["limit"]:
+            break
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+        total -= size
+    return None
+
+def scan(path):
+    try:
+        return [entry.path for entry in os.scandir(path)]
+    except OSError:
+        return []
+
+def UI(preferences, layout):
+    col = layout.box().column()
+    col.use_property_split = True
+    col.use_property_decorate = False
+    col.label(text="Geometry Cache")
+
+    col.prop(preferences, "use_cache")
+    sub = col.column()
+    sub.enabled = preferences.use_cache
+    sub.prop(preferences, "directory")
+    sub.prop(preferences, "size")
+    return None
+
+@addon.property
+class Preferences_Cache(bpy.types.PropertyGroup):
+    use_cache : bpy.props.BoolProperty(
+        name = "Enable",
+        default = False,
+    )
+
+    directory : bpy.props.StringProperty(
+        name = "Directory",
+        subtype = 'DIR_PATH',
+        default = "",
+    )
+
+    size : bpy.props.IntProperty(
+        name = "Size (MB)",
+        default = 4096,
+        min = 0,
+    )
+
+CLASSES = [
+    Preferences_Cache,
+]
+
+def register():
+    utils.bpy.register_classes(CLASSES)
+    return None
+
+def unregister():
+    utils.bpy.unregister_classes(CLASSES)
+    return None
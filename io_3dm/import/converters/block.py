@@ -1,8 +1,8 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
-import mathutils
+import itertools
 
 import bpy
-import rhino3dm
+import numpy
 
 from io_3dm import utils
 
@@ -10,42 +10,99 @@ def def_single_mesh(rhdef, children, name=None, options=None):
     name = name if name is not None else rhdef.Name
 
     bldata = utils.bpy.obt(bpy.data.meshes, str(rhdef.Id), force=True)
+    # NOTE: An existing definition mesh is rebuilt, not joined onto.
+    bldata.clear_geometry()
     bldef =  utils.bpy.obt(bpy.data.objects, name, data=bldata, force=True)
-    utils.bpy.obj.join(bldef, children)
+    utils.bpy.obj.join(bldef, children, normals=(options.mesh_shading == 'RHINO'))
     return bldef
 
 def ins_single_mesh(rhref, bldef, name=None, options=None):
     name = name if name is not None else str(rhref.Attributes.Id)
 
     blref =  utils.bpy.obt(bpy.data.objects, name, data=bldef.data, force=True)
+    return blref
+
+def ins_points(rhrefs, bldef, name=None, options=None):
+    """Returns one object instancing bldef on a point per reference.
+
+    Transforms are written in bulk to a matrix attribute and applied by a
+    shared Geometry Nodes group, so object count does not grow with
+    references.
+    """
+    name = name if name is not None else bldef.name
 
-    transform=list(rhref.Geometry.Xform.ToFloatArray(1))
-    transform=[transform[0:4],transform[4:8], transform[8:12], transform[12:16]]
-    transform[0][3] *= 1
-    transform[1][3] *= 1
-    transform[2][3] *= 1
+    transforms = matrices(rhrefs, options.scale)
 
-    blref.matrix_world = mathutils.Matrix(transform)
+    bldata = utils.bpy.obt(bpy.data.meshes, name, force=True, overwrite='NEW')
+    bldata.vertices.add(len(transforms))
+    bldata.vertices.foreach_set("co", numpy.ascontiguousarray(transforms[:, :3, 3]).ravel())
+    # NOTE: Blender matrices are stored column major.
+    attribute = bldata.attributes.new("transform", 'FLOAT4X4', 'POINT')
+    attribute.data.foreach_set("value", numpy.ascontiguousarray(transforms.transpose(0, 2, 1)).ravel())
+
+    blref = utils.bpy.obt(bpy.data.objects, name, data=bldata, force=True, overwrite='NEW')
+    blgroup = points_group()
+    modifier = blref.modifiers.new("Instances", 'NODES')
+    modifier.node_group = blgroup
+    modifier[blgroup.interface.items_tree["Collection"].identifier] = bldef
     return blref
 
-def def_collection_instance(rhdef, name=None):
-    name = name if name is not None else rhdef.Name
-    bldef = utils.bpy.obt(bpy.data.collections, name, force=True)
-    return bldef
+def points_group(name="IO3DM Instance on Points"):
+    blgroup = utils.bpy.obt(bpy.data.node_groups, name, type='GeometryNodeTree', force=True)
+    if len(blgroup.nodes) > 0:
+        return blgroup
 
-def ref_collection_instance(rhref, name=None, scale=1.0):
-    iname = name if name is not None else str(rhref.Attributes.Id)
-    blref = utils.bpy.obt(bpy.data.objects, name, force=True)
+    interface = blgroup.interface
+    interface.new_socket("Geometry", in_out='INPUT', socket_type='NodeSocketGeometry')
+    interface.new_socket("Collection", in_out='INPUT', socket_type='NodeSocketCollection')
+    interface.new_socket("Geometry", in_out='OUTPUT', socket_type='NodeSocketGeometry')
 
-    blref.empty_display_size=0.5
-    blref.empty_display_type='PLAIN_AXES'
-    blref.instance_type='COLLECTION'
+    nodes = blgroup.nodes
+    group_input = nodes.new("NodeGroupInput")
+    group_output = nodes.new("NodeGroupOutput")
+    info = nodes.new("GeometryNodeCollectionInfo")
+    info.transform_space = 'ORIGINAL'
+    attribute = nodes.new("GeometryNodeInputNamedAttribute")
+    attribute.data_type = 'FLOAT4X4'
+    attribute.inputs["Name"].default_value = "transform"
+    points = nodes.new("GeometryNodeInstanceOnPoints")
+    transform = nodes.new("GeometryNodeSetInstanceTransform")
 
-    transform=list(rhref.Geometry.Xform.ToFloatArray(1))
-    transform=[transform[0:4],transform[4:8], transform[8:12], transform[12:16]]
-    transform[0][3]*=scale
-    transform[1][3]*=scale
-    transform[2][3]*=scale
+    links = blgroup.links
+    links.new(group_input.outputs["Collection"], info.inputs["Collection"])
+    links.new(group_input.outputs["Geometry"], points.inputs["Points"])
+    links.new(info.outputs["Instances"], points.inputs["Instance"])
+    links.new(points.outputs["Instances"], transform.inputs["Instances"])
+    links.new(attribute.outputs["Attribute"], transform.inputs["Transform"])
+    links.new(transform.outputs["Instances"], group_output.inputs["Geometry"])
+    return blgroup
+
+def matrices(rhrefs, scale=1.0):
+    """Returns (N, 4, 4) row major instance transforms in scene units."""
+    transforms = numpy.fromiter(
+        itertools.chain.from_iterable(rhref.Geometry.Xform.ToFloatArray(True) for rhref in rhrefs),
+        dtype = numpy.float32,
+        count = 16 * len(rhrefs),
+    ).reshape(-1, 4, 4)
+    transforms[:, :3, 3] *= scale
+    return transforms
+
+def def_collection_instance(rhdef, children, name=None, options=None):
+    name = name if name is not None else f"{options.name}::{rhdef.Name}"
+
+    # NOTE: Never reuse a collection from a previous import, it holds stale children.
+    bldef = utils.bpy.obt(bpy.data.collections, name, force=True, overwrite='NEW')
+    for child in children:
+        if child.name not in bldef.objects:
+            bldef.objects.link(child)
+    return bldef
+
+def ins_collection_instance(rhref, bldef, name=None, options=None):
+    name = name if name is not None else str(rhref.Attributes.Id)
 
-    blref.matrix_world = mathutils.Matrix(transform)
+    blref = utils.bpy.obt(bpy.data.objects, name, data=None, force=True)
+    blref.empty_display_size = 0.5
+    blref.empty_display_type = 'PLAIN_AXES'
+    blref.instance_type = 'COLLECTION'
+    blref.instance_collection = bldef
     return blref
\ No newline at end of file
@@ -1,9 +1,21 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
+import itertools
+import operator
+
 import bpy
 import bmesh
+import farmhash
 import mathutils
-import math
+import numpy
 import rhino3dm
+from rhino import decode
+
+from io_3dm import utils
+
+_XYZW = operator.attrgetter("X", "Y", "Z", "W")
+_GRID_SPAN = 1 << 21
+_DIGEST_PRECISION = 1e-5
+_DIGEST_PRECISION_NORMALS = 1e-4
 
 def vector(rhvector):
     match type(rhvector):
@@ -20,46 +32,232 @@ def vector(rhvector):
     return blvector
 
 def mesh(rhob, scale, options):
-    # Get meshes
-    match rhob.Geometry.ObjectType:
-        case rhino3dm.ObjectType.Extrusion:
-            rhmesh = [rhob.Geometry.GetMesh(rhino3dm.MeshType.Any)]
-        case rhino3dm.ObjectType.Mesh:
-            rhmesh = [rhob.Geometry]
-        case rhino3dm.ObjectType.SubD:
-            rhmesh = [rhino3dm.Mesh.CreateFromSubDControlNet(rhob.Geometry)]
-        case rhino3dm.ObjectType.Brep:
-            rhmesh = [rhob.Geometry.Faces[f].GetMesh(rhino3dm.MeshType.Any) for f in range(len(rhob.Geometry.Faces)) if type(rhob.Geometry.Faces[f])!=list]
-
-    findex = 0
-    faces = []
-    vertices = []
-
-    # Add faces and vertices to lists
-    for mesh in rhmesh:
-        if mesh:
-            mesh.Faces.CullDegenerateFaces()
-            mesh.Faces.ConvertTrianglesToQuads(math.pi / 90.0, 0.875)
-
-            faces.extend([list(map(lambda x: x + findex, mesh.Faces[f])) for f in range(len(mesh.Faces))])
-
-            # Rhino always uses 4 values to describe faces, which can lead to
-            ## invalid faces in Blender. Tris will have a duplicate index for the 4th
-            ## value.
-            for f in faces:
-                if f[-1] == f[-2]:
-                    del f[-1]
-
-            findex = findex + len(mesh.Vertices)
-            vertices.extend([(mesh.Vertices[v].X * scale, mesh.Vertices[v].Y * scale, mesh.Vertices[v].Z * scale) for v in range(len(mesh.Vertices))])
-
-    blmesh = bpy.data.meshes.new(name=str(rhob.Attributes.Id)) # Create empty mesh
-    blmesh.from_pydata(vertices, [], faces)
+    pymesh = mesh_pymesh(rhob, scale)
+    pymesh_join_maybe(pymesh, rhob, options)
+    return mesh_blmesh(str(rhob.Attributes.Id), pymesh, options)
+
+def mesh_pymesh(rhob, scale):
+    rhmeshes = decode.render_meshes(rhob.Geometry)
+    pymesh = mesh_arrays(rhmeshes, scale)
+    return pymesh
+
+def mesh_blmesh(name, pymesh, options):
+    blmesh = bpy.data.meshes.new(name=name) # Create empty mesh
+    utils.bpy.mesh.from_arrays(blmesh, pymesh["vertices"], pymesh["loops"], pymesh["starts"], pymesh["totals"])
 
     blmesh_join_maybe(blmesh, options)
-    blmesh_shadesmooth_maybe(blmesh, options)
+    blmesh_shadesmooth_maybe(blmesh, pymesh, options)
     return blmesh
 
+def mesh_arrays(rhmeshes, scale):
+    return mesh_assemble(decode.mesh_buffers(rhmeshes, scale, mesh_normals_maybe))
+
+def mesh_assemble(buffers):
+    """Builds a pymesh from extracted vertices, faces and normals."""
+    pymesh = mesh_topology(buffers["faces"])
+    pymesh["vertices"] = buffers["vertices"]
+    if "normals" in buffers:
+        # Stored per loop, so they survive welding of seam vertices.
+        pymesh["normals"] = buffers["normals"][pymesh["loops"]]
+    return pymesh
+
+def mesh_center(pymesh):
+    """Moves vertices so their bounding box minimum sits at the origin.
+
+    Returns the removed offset, which becomes the object location.
+    """
+    vertices = pymesh["vertices"]
+    if len(vertices) == 0:
+        return numpy.zeros(3)
+    origin = vertices.min(axis=0).astype(numpy.float64)
+    pymesh["vertices"] = (vertices - origin).astype(numpy.float32)
+    return origin
+
+def mesh_digest(pymesh):
+    """Hashes geometry only, translated copies of a mesh share a digest."""
+    digest = 0
+    # NOTE: Copies placed elsewhere round differently, compare on a fine grid.
+    arrays = [numpy.rint(pymesh["vertices"] / _DIGEST_PRECISION).astype(numpy.int64), pymesh["loops"], pymesh["totals"]]
+    if "normals" in pymesh:
+        arrays.append(numpy.rint(pymesh["normals"] / _DIGEST_PRECISION_NORMALS).astype(numpy.int32))
+    for array in arrays:
+        digest = farmhash.FarmHash64WithSeed(numpy.ascontiguousarray(array), digest)
+    return digest
+
+def hash_mesh(pymesh, seed=0):
+    """Hashes the extracted buffers in place, no copy or string is made."""
+    for key in ("vertices", "loops", "totals", "normals"):
+        if key in pymesh:
+            seed = farmhash.FarmHash64WithSeed(pymesh[key], seed)
+    return seed
+
+def hash_curve(rhcurve, seed=0):
+    rhnurbs = rhcurve.ToNurbsCurve()
+    if rhnurbs is None:
+        return hash_encoded(rhcurve, seed)
+    rhpoints = rhnurbs.Points
+    count = len(rhpoints)
+    points = numpy.fromiter(
+        itertools.chain.from_iterable(map(_XYZW, map(rhpoints.__getitem__, range(count)))),
+        dtype = numpy.float64,
+        count = count * 4,
+    )
+    knots = numpy.array(rhnurbs.Knots.ToList(), dtype=numpy.float64)
+    seed = farmhash.FarmHash64WithSeed(points, seed)
+    seed = farmhash.FarmHash64WithSeed(knots, seed)
+    return farmhash.FarmHash64WithSeed(numpy.array((rhnurbs.Order, rhnurbs.IsClosed), dtype=numpy.int32), seed)
+
+def hash_transform(rhxform, seed=0):
+    return farmhash.FarmHash64WithSeed(numpy.array(rhxform.ToFloatArray(True), dtype=numpy.float64), seed)
+
+def hash_encoded(rhgeometry, seed=0):
+    return farmhash.FarmHash64WithSeed(rhgeometry.Encode()["data"], seed)
+
+def mesh_topology(faces):
+    """Converts (F, 4) Rhino faces into Blender polygon arrays, in a
+    handful of array operations.
+    """
+    # Rhino always uses 4 values to describe faces, which can lead to
+    ## invalid faces in Blender. Tris will have a duplicate index for the 4th
+    ## value.
+    quads = faces[:, 3] != faces[:, 2]
+    mask = numpy.ones(faces.shape, dtype=bool)
+    mask[:, 3] = quads
+
+    totals = quads.astype(numpy.int32) + 3
+    starts = numpy.zeros(len(totals), dtype=numpy.int32)
+    numpy.cumsum(totals[:-1], out=starts[1:])
+
+    pymesh = {
+        "loops" : faces[mask].astype(numpy.int32, copy=False),
+        "starts" : starts,
+        "totals" : totals,
+    }
+    return pymesh
+
+def mesh_normals_maybe(rhmesh):
+    return None
+
+def mesh_normals_false(rhmesh):
+    return None
+
+def mesh_normals_true(rhmesh):
+    return decode.mesh_normals(rhmesh)
+
+def pymesh_join_maybe(pymesh, rhob, options):
+    return None
+
+def pymesh_join_false(pymesh, rhob, options):
+    return None
+
+def pymesh_join_true(pymesh, rhob, options):
+    if rhob.Geometry.ObjectType == rhino3dm.ObjectType.Brep and mesh_join_brep(pymesh, rhob.Geometry):
+        return None
+    mesh_weld(pymesh, options.mesh_join_threshold)
+    return None
+
+def mesh_join_brep(pymesh, rhbrep):
+    """Stitches per-face render meshes along the Brep edges they share.
+
+    Rhino meshes every Brep edge once and reuses those points on both
+    adjacent faces, so seam vertices are bit identical. Only vertices on the
+    naked boundary of a face mesh can lie on an edge, and only those are
+    matched, by exact position, without any distance search.
+    """
+    if len(rhbrep.Faces) < 2 or len(rhbrep.Edges) == 0:
+        return False
+    mesh_weld(pymesh, 0.0, candidates=mesh_naked_vertices(pymesh))
+    return True
+
+def mesh_weld(pymesh, distance, candidates=None):
+    """Merges vertices sharing a cell of a `distance` sized grid, in place.
+
+    With `distance` 0.0 only bit identical positions are merged. When
+    `candidates` is given, only those vertex indices are considered. Loops
+    are remapped in the same pass, then collapsed loops and faces left with
+    less than 3 distinct vertices are dropped.
+    """
+    vertices = pymesh["vertices"]
+    if candidates is None:
+        candidates = numpy.arange(len(vertices))
+    if len(candidates) == 0:
+        return pymesh
+
+    if distance > 0.0:
+        # NOTE: Cells are centered on multiples of distance, CAD coordinates
+        ## tend to sit right there and would otherwise straddle two cells.
+        keys = numpy.rint(vertices[candidates] / distance).astype(numpy.int64)
+        keys -= keys.min(axis=0)
+    else:
+        # NOTE: Adding 0.0 turns -0.0 into 0.0 so both share the same bits.
+        keys = numpy.ascontiguousarray(vertices[candidates] + numpy.float32(0.0))
+
+    if distance > 0.0 and keys.max() < _GRID_SPAN:
+        # Pack the three cell coordinates into one integer.
+        keys = (keys[:, 0] << 42) | (keys[:, 1] << 21) | keys[:, 2]
+    else:
+        # Compare whole rows as raw bytes, still a 1D unique.
+        keys = keys.view(numpy.dtype((numpy.void, keys.itemsize * 3))).ravel()
+
+    _, first, inverse = numpy.unique(keys, return_index=True, return_inverse=True)
+
+    # Every vertex points to the first vertex of its cell, which is kept.
+    ## Kept vertices stay in their original order.
+    target = numpy.arange(len(vertices))
+    target[candidates] = candidates[first[inverse.reshape(-1)]]
+    kept = target == numpy.arange(len(vertices))
+    rank = numpy.cumsum(kept) - 1
+
+    pymesh["vertices"] = vertices[kept]
+    pymesh["loops"] = rank[target][pymesh["loops"]].astype(numpy.int32)
+    mesh_collapse(pymesh)
+    return pymesh
+
+def mesh_collapse(pymesh):
+    loops = pymesh["loops"]
+    starts = pymesh["starts"]
+    totals = pymesh["totals"]
+    if len(totals) == 0:
+        return pymesh
+
+    keep = loops != loops[mesh_following(starts, totals)]
+
+    faces = numpy.repeat(numpy.arange(len(totals)), totals)
+    totals = numpy.bincount(faces[keep], minlength=len(totals)).astype(numpy.int32)
+    valid = totals >= 3
+
+    # Quads whose opposite corners were welded are degenerate as well.
+    quads = starts[(pymesh["totals"] == 4) & (totals == 4)]
+    bowtie = (loops[quads] == loops[quads + 2]) | (loops[quads + 1] == loops[quads + 3])
+    valid[faces[quads[bowtie]]] = False
+
+    keep &= valid[faces]
+    totals = totals[valid]
+    starts = numpy.zeros(len(totals), dtype=numpy.int32)
+    numpy.cumsum(totals[:-1], out=starts[1:])
+
+    pymesh["loops"] = loops[keep]
+    pymesh["starts"] = starts
+    pymesh["totals"] = totals
+    if "normals" in pymesh:
+        pymesh["normals"] = pymesh["normals"][keep]
+    return pymesh
+
+def mesh_following(starts, totals):
+    """Index of the next loop in the same face for every loop, wrapping around."""
+    following = numpy.arange(1, totals.sum() + 1)
+    following[starts + totals - 1] = starts
+    return following
+
+def mesh_naked_vertices(pymesh):
+    loops = pymesh["loops"].astype(numpy.int64)
+    following = loops[mesh_following(pymesh["starts"], pymesh["totals"])]
+
+    edges = (numpy.minimum(loops, following) << 32) | numpy.maximum(loops, following)
+    edges, counts = numpy.unique(edges, return_counts=True)
+    naked = edges[counts == 1]
+    return numpy.unique(numpy.concatenate((naked >> 32, naked & 0xFFFFFFFF)))
+
 def blmesh_join_maybe(blmesh, options):
     return None
 
@@ -74,19 +272,26 @@ def blmesh_join_true(blmesh, options):
     new.free()
     return None
 
-def blmesh_shadesmooth_maybe(blmesh, options):
+def blmesh_shadesmooth_maybe(blmesh, pymesh, options):
     return None
 
-def blmesh_shadesmooth_false(blmesh, options):
-    # NOTE: No need to shade flat since new meshes are always flat shaded.
-    # blmesh.shade_flat()
+def blmesh_shadesmooth_false(blmesh, pymesh, options):
+    # NOTE: No need to shade flat, utils.bpy.mesh.from_arrays builds flat meshes.
     return None
 
-def blmesh_shadesmooth_true(blmesh, options):
+def blmesh_shadesmooth_true(blmesh, pymesh, options):
     blmesh.shade_smooth()
     blmesh.set_sharp_from_angle(angle=0.6)
     return None
 
+def blmesh_shadesmooth_rhino(blmesh, pymesh, options):
+    # NOTE: BMesh joining rebuilds loops, Rhino normals no longer line up then.
+    if "normals" in pymesh and len(pymesh["normals"]) == len(blmesh.loops):
+        utils.bpy.mesh.set_normals(blmesh, pymesh["normals"])
+    else:
+        blmesh_shadesmooth_true(blmesh, pymesh, options)
+    return None
+
 def curve(rhob, scale, options):
     blcurve = bpy.data.curves.new(name=str(rhob.Attributes.Id), type='CURVE') # Create empty curve
     _IMPORT_CURVE[type(rhob.Geometry)](rhob.Geometry, blcurve, scale)
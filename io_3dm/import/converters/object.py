@@ -5,9 +5,32 @@ import rhino3dm
 from io_3dm import utils
 from . import geometry
 
-def new(rhob, name=None, options=None):
+def new(rhob, name=None, options=None, meshes=None, pymesh=None):
     if name is None:
         name = str(rhob.Attributes.Id)
-    bldata = geometry.RHINO_IMPORT[rhob.Geometry.ObjectType](rhob, options.scale, options=options)
+    convert = geometry.RHINO_IMPORT[rhob.Geometry.ObjectType]
+    if meshes is not None and convert is geometry.mesh:
+        return new_shared(rhob, name, meshes, options=options, pymesh=pymesh)
+    bldata = convert(rhob, options.scale, options=options)
     blob =  utils.bpy.obt(bpy.data.objects, name, data=bldata, force=True)
+    return blob
+
+def new_shared(rhob, name, meshes, options=None, pymesh=None):
+    """Links objects with identical geometry to the same mesh datablock.
+
+    A pymesh carrying an origin is already joined and centered.
+    """
+    if pymesh is None:
+        pymesh = geometry.mesh_pymesh(rhob, options.scale)
+    if "origin" not in pymesh:
+        geometry.pymesh_join_maybe(pymesh, rhob, options)
+        pymesh["origin"] = geometry.mesh_center(pymesh)
+    digest = geometry.mesh_digest(pymesh)
+
+    bldata = meshes.get(digest)
+    if bldata is None:
+        bldata = meshes[digest] = geometry.mesh_blmesh(name, pymesh, options)
+
+    blob =  utils.bpy.obt(bpy.data.objects, name, data=bldata, force=True)
+    blob.location = pymesh["origin"]
     return blob
\ No newline at end of file
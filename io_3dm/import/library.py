@@ -0,0 +1,90 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+import os
+
+import bpy
+import farmhash
+
+from io_3dm import utils
+from . import cache
+addon = utils.bpy.Addon()
+
+# NOTE: Derived per import or unrelated to the converted data, the project
+## name only labels it, scenes importing under other names share the library.
+_UNKEYED = {"rna_type", "name", "scale", "force_reload", "library"}
+
+def log(message):
+    print(f"{addon.name} :: Library :: {message}")
+    return None
+
+def init(context, filepath, options):
+    """Returns the library state for one import, None if disabled.
+
+    A converted file is stored next to it as `<name>.<key>.blend`, the key
+    covers the file content, the import options and the scene unit scale.
+    Linked projects keep the name they were converted under.
+    """
+    if options.library == 'NONE':
+        return None
+
+    values = sorted(
+        (prop.identifier, getattr(options, prop.identifier))
+        for prop in options.bl_rna.properties if prop.identifier not in _UNKEYED
+    )
+    signature = farmhash.FarmHash64(repr((values, context.scene.unit_settings.scale_length)))
+    key = cache.digest(filepath, signature)
+    if key is None:
+        return None
+
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    pylibrary = {
+        "path" : os.path.join(os.path.dirname(os.path.abspath(filepath)), f"{name}.{key:016x}.blend"),
+        "link" : options.library == 'LINK',
+        "name" : options.name,
+        "ids" : None,
+    }
+    return pylibrary
+
+def exists(pylibrary):
+    return os.path.isfile(pylibrary["path"])
+
+def load(context, pylibrary):
+    """Links or appends the converted project into the scene, returns it."""
+    log(f"{'Linking' if pylibrary['link'] else 'Appending'} '{os.path.basename(pylibrary['path'])}'")
+    # NOTE: Loading every collection costs nothing, they all depend on the project.
+    with bpy.data.libraries.load(pylibrary["path"], link=pylibrary["link"]) as (data_from, data_to):
+        data_to.collections = list(data_from.collections)
+
+    b3dm = next((blcol for blcol in data_to.collections if blcol is not None and getattr(blcol, addon.name).project), None)
+    if b3dm is None:
+        log("No project found")
+        return None
+    context.scene.collection.children.link(b3dm)
+    if not pylibrary["link"]:
+        b3dm.name = pylibrary["name"]
+        b3dm.use_fake_user = False
+    return b3dm
+
+def write(pylibrary, b3dm):
+    """Writes the project and everything it uses, returns True on success."""
+    path = pylibrary["path"]
+    temp = f"{path}.tmp"
+    log(f"Writing '{os.path.basename(path)}'")
+    try:
+        # NOTE: Textures have to be found from any file linking the library.
+        bpy.data.libraries.write(temp, {b3dm}, path_remap='ABSOLUTE', fake_user=True)
+        os.replace(temp, path)
+    except (OSError, RuntimeError):
+        log(f"Failed to write '{path}'")
+        if os.path.isfile(temp):
+            os.remove(temp)
+        return False
+    return True
+
+def unlink(context, name):
+    """Removes a loaded project from the scene, purging it unless linked."""
+    b3dm = context.scene.collection.children[name]
+    context.scene.collection.children.unlink(b3dm)
+    if b3dm.library is None:
+        b3dm.use_fake_user = False
+        utils.bpy.purge(utils.bpy.dependencies({b3dm}))
+    return None
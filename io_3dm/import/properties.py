@@ -9,6 +9,12 @@ class IO3DM_hash(bpy.types.PropertyGroup):
         name = "Data",
         type = bpy.types.Object,
     )
+    geometry : bpy.props.StringProperty(
+        name = "Geometry",
+    )
+    shading : bpy.props.StringProperty(
+        name = "Shading",
+    )
 
 class Collection(bpy.types.PropertyGroup):
     project : bpy.props.BoolProperty()
@@ -0,0 +1,237 @@
+"""Extracts render mesh buffers of a 3dm file, in worker processes if asked.
+
+Nothing in here may import bpy, spawned workers import this module through
+the bundled rhino package only.
+"""
+import collections
+import itertools
+import math
+import multiprocessing
+import operator
+import os
+import secrets
+import sys
+import threading
+from multiprocessing import shared_memory
+
+import numpy
+import rhino3dm
+
+_XYZ = operator.attrgetter("X", "Y", "Z")
+_ALIGN = 64
+_CHUNK = 64
+
+# NOTE: Per worker process. A Windows mapping only lives while a handle is
+## open, there workers keep their blocks until the pool stops.
+_FILES = {}
+_BLOCKS = []
+
+def render_meshes(rhgeo):
+    match rhgeo.ObjectType:
+        case rhino3dm.ObjectType.Extrusion:
+            rhmeshes = [rhgeo.GetMesh(rhino3dm.MeshType.Any)]
+        case rhino3dm.ObjectType.Mesh:
+            rhmeshes = [rhgeo]
+        case rhino3dm.ObjectType.SubD:
+            rhmeshes = [rhino3dm.Mesh.CreateFromSubDControlNet(rhgeo)]
+        case rhino3dm.ObjectType.Brep:
+            rhmeshes = [rhgeo.Faces[f].GetMesh(rhino3dm.MeshType.Any) for f in range(len(rhgeo.Faces)) if type(rhgeo.Faces[f])!=list]
+        case _:
+            rhmeshes = []
+    return rhmeshes
+
+def mesh_buffers(rhmeshes, scale, normals=None):
+    """Concatenates vertices, (F, 4) faces and optional normals of meshes.
+
+    normals is called per mesh and may return None to skip normals.
+    """
+    vindex = 0
+    faces = []
+    vertices = []
+    pynormals = []
+
+    # Add faces and vertices to arrays
+    for rhmesh in rhmeshes:
+        if rhmesh:
+            rhmesh.Faces.CullDegenerateFaces()
+            rhmesh.Faces.ConvertTrianglesToQuads(math.pi / 90.0, 0.875)
+
+            faces.append(mesh_faces(rhmesh) + vindex)
+            vertices.append(mesh_vertices(rhmesh, scale))
+            pynormals.append(normals(rhmesh) if normals is not None else None)
+            vindex = vindex + len(vertices[-1])
+
+    buffers = {
+        "vertices" : numpy.concatenate(vertices) if vertices else numpy.empty((0, 3), dtype=numpy.float32),
+        "faces" : numpy.concatenate(faces) if faces else numpy.empty((0, 4), dtype=numpy.int32),
+    }
+    if pynormals and all(n is not None for n in pynormals):
+        buffers["normals"] = numpy.concatenate(pynormals)
+    return buffers
+
+def mesh_vertices(rhmesh, scale):
+    rhvertices = rhmesh.Vertices
+    count = len(rhvertices)
+    vertices = numpy.fromiter(
+        itertools.chain.from_iterable(map(_XYZ, map(rhvertices.__getitem__, range(count)))),
+        dtype = numpy.float32,
+        count = count * 3,
+    ).reshape(count, 3)
+    vertices *= scale
+    return vertices
+
+def mesh_faces(rhmesh):
+    rhfaces = rhmesh.Faces
+    count = len(rhfaces)
+    faces = numpy.fromiter(
+        itertools.chain.from_iterable(map(rhfaces.__getitem__, range(count))),
+        dtype = numpy.int32,
+        count = count * 4,
+    ).reshape(count, 4)
+    return faces
+
+def mesh_normals(rhmesh):
+    rhnormals = rhmesh.Normals
+    if len(rhnormals) != len(rhmesh.Vertices):
+        rhnormals.ComputeNormals()
+    count = len(rhnormals)
+    normals = numpy.fromiter(
+        itertools.chain.from_iterable(map(_XYZ, map(rhnormals.__getitem__, range(count)))),
+        dtype = numpy.float32,
+        count = count * 3,
+    ).reshape(count, 3)
+    return normals
+
+def extract(path, indices, scale, normals, name):
+    """Worker side, shares the buffers of objects at indices in block name.
+
+    Returns a descriptor {"name", "meshes" : {rhid : {key : (offset, shape, dtype)}}}.
+    """
+    rhfile = _FILES.get(path)
+    if rhfile is None:
+        rhfile = _FILES[path] = rhino3dm.File3dm.Read(path)
+    rhobjects = rhfile.Objects
+
+    pybuffers = {}
+    for index in indices:
+        rhob = rhobjects[index]
+        pybuffers[str(rhob.Attributes.Id)] = mesh_buffers(render_meshes(rhob.Geometry), scale, mesh_normals if normals else None)
+
+    size = 0
+    layout = {}
+    for rhid, buffers in pybuffers.items():
+        layout[rhid] = {}
+        for key, array in buffers.items():
+            layout[rhid][key] = (size, array.shape, array.dtype.str)
+            size = size + -(-array.nbytes // _ALIGN) * _ALIGN
+
+    shm = shared_memory.SharedMemory(name=name, create=True, size=max(size, 1))
+    for rhid, buffers in pybuffers.items():
+        for key, array in buffers.items():
+            offset, shape, dtype = layout[rhid][key]
+            numpy.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = array
+    if os.name == "posix":
+        # NOTE: The segment outlives the mapping until the parent unlinks it.
+        shm.close()
+    else:
+        _BLOCKS.append(shm)
+    return {"name" : shm.name, "meshes" : layout}
+
+def start(path, indices, rhids, scale, normals=False, workers=1):
+    """Starts decoding objects at indices of path in a pool of workers.
+
+    rhids are the ids of those objects, nothing else is ever waited for.
+
+    Chunks are submitted in order, so fetch can consume them while later
+    ones are still being extracted.
+    """
+    # NOTE: Blender must never fork, spawned workers only need the libs on their path.
+    context = multiprocessing.get_context("spawn")
+    libs = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    delete = False
+    try:
+        if libs not in sys.path:
+            sys.path.insert(0, libs)
+            delete = True
+        pool = context.Pool(processes=workers)
+    finally:
+        if delete:
+            sys.path.remove(libs)
+
+    # NOTE: Blocks are named up front, so chunks cut off by close can be unlinked.
+    prefix = f"io3dm_{secrets.token_hex(4)}"
+    chunk = max(1, min(_CHUNK, -(-len(indices) // workers)))
+    results = [
+        (pool.apply_async(extract, (path, indices[i:i + chunk], scale, normals, f"{prefix}_{i}")), f"{prefix}_{i}", rhids[i:i + chunk])
+        for i in range(0, len(indices), chunk)
+    ]
+    pool.close()
+
+    pydecode = {
+        "pool" : pool,
+        "results" : collections.deque(results),
+        "scheduled" : set(rhids),
+        "buffers" : {},
+        "lock" : threading.Lock(),
+    }
+    return pydecode
+
+def fetch(pydecode, rhid):
+    """Returns the buffers of rhid, waiting for its chunk if necessary.
+
+    None for objects not scheduled, already fetched or whose worker failed,
+    those are left to the caller.
+    """
+    buffers = pydecode["buffers"]
+    results = pydecode["results"]
+    scheduled = pydecode["scheduled"]
+    # NOTE: Fetched from the extraction thread and the main thread.
+    with pydecode["lock"]:
+        if rhid not in scheduled:
+            return None
+        scheduled.discard(rhid)
+        while rhid not in buffers and results:
+            result, name, rhids = results.popleft()
+            try:
+                attach(pydecode, result.get())
+            except Exception:
+                # NOTE: Meshes of a failed chunk are extracted by the caller.
+                scheduled.difference_update(rhids)
+                release(name)
+        return buffers.pop(rhid, None)
+
+def attach(pydecode, descriptor):
+    """Copies the buffers out of a block and unlinks it right away, so at
+    most one chunk is held twice.
+    """
+    shm = shared_memory.SharedMemory(name=descriptor["name"])
+    try:
+        for rhid, layout in descriptor["meshes"].items():
+            buffers = pydecode["buffers"][rhid] = {}
+            for key, (offset, shape, dtype) in layout.items():
+                buffers[key] = numpy.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+    return None
+
+def release(name):
+    """Unlinks block name if a worker got to create it."""
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return None
+    shm.close()
+    shm.unlink()
+    return None
+
+def close(pydecode):
+    """Stops the workers and releases every block not attached yet."""
+    results = pydecode["results"]
+    pydecode["pool"].terminate()
+    while results:
+        _, name, _ = results.popleft()
+        release(name)
+    pydecode["buffers"].clear()
+    pydecode["scheduled"].clear()
+    return None
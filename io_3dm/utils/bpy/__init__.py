@@ -1,6 +1,7 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 from . import col
 from . import img
+from . import mesh
 from . import obj
 from . import ops
 from . import rna2json
@@ -0,0 +1,54 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+import bpy
+import numpy
+
+def from_arrays(blmesh, vertices, loops, starts, totals):
+    """Fills an empty mesh from flat arrays in one pass per attribute.
+    Polygons are flat shaded, like from_pydata makes them.
+
+    vertices: (V, 3) float32, loops: (L,) int32, starts/totals: (F,) int32.
+    """
+    blmesh.vertices.add(len(vertices))
+    blmesh.vertices.foreach_set("co", numpy.ascontiguousarray(vertices, dtype=numpy.float32).ravel())
+
+    blmesh.loops.add(len(loops))
+    blmesh.loops.foreach_set("vertex_index", numpy.ascontiguousarray(loops, dtype=numpy.int32))
+
+    blmesh.polygons.add(len(totals))
+    blmesh.polygons.foreach_set("loop_start", numpy.ascontiguousarray(starts, dtype=numpy.int32))
+    # NOTE: Since 4.0 polygon sizes are derived from the next loop_start.
+    if bpy.app.version < (4, 0, 0):
+        blmesh.polygons.foreach_set("loop_total", numpy.ascontiguousarray(totals, dtype=numpy.int32))
+
+    # NOTE: Since 4.1 polygons without a sharp_face attribute are smooth.
+    if bpy.app.version >= (4, 1, 0):
+        blmesh.shade_flat()
+
+    blmesh.update(calc_edges=True)
+    return blmesh
+
+def set_normals(blmesh, normals):
+    """Sets (L, 3) per loop normals as custom split normals."""
+    blmesh.shade_smooth()
+    # NOTE: Custom normals need auto smooth before 4.1.
+    if hasattr(blmesh, "use_auto_smooth"):
+        blmesh.use_auto_smooth = True
+    blmesh.normals_split_custom_set(normals)
+    return blmesh
+
+def corner_normals(blmesh, matrix=None):
+    """Returns (L, 3) per loop normals, optionally transformed by matrix."""
+    normals = numpy.empty(len(blmesh.loops) * 3, dtype=numpy.float32)
+    if hasattr(blmesh, "corner_normals"):
+        blmesh.corner_normals.foreach_get("vector", normals)
+    else:
+        blmesh.calc_normals_split()
+        blmesh.loops.foreach_get("normal", normals)
+    normals = normals.reshape(-1, 3)
+
+    if matrix is not None:
+        # Normals transform by the inverse transpose, rows on the left side.
+        normals = normals @ numpy.array(matrix.to_3x3().inverted_safe(), dtype=numpy.float32)
+        lengths = numpy.linalg.norm(normals, axis=1, keepdims=True)
+        numpy.divide(normals, lengths, out=normals, where=lengths > 0.0)
+    return normals
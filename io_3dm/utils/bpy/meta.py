@@ -49,5 +49,57 @@ def _create(datablock, id, **kwargs):
             bldat = datablock.new(id)
     return bldat
 
+def dependencies(ids):
+    """Returns ids with every datablock they use, through objects, meshes,
+    collections and Geometry Nodes modifier inputs.
+    """
+    stack = list(ids)
+    seen = set()
+    while stack:
+        id = stack.pop()
+        if id is None or id in seen:
+            continue
+        try:
+            match id:
+                case bpy.types.Object():
+                    stack.append(id.data)
+                    stack.append(id.instance_collection)
+                    stack.extend(slot.material for slot in id.material_slots)
+                    for modifier in id.modifiers:
+                        if modifier.type == 'NODES':
+                            stack.append(modifier.node_group)
+                            stack.extend(value for value in modifier.values() if isinstance(value, bpy.types.ID))
+                case bpy.types.Mesh():
+                    stack.extend(id.materials)
+                case bpy.types.Collection():
+                    stack.extend(id.objects)
+                    stack.extend(id.children)
+        except ReferenceError:
+            # NOTE: Removed meanwhile.
+            continue
+        seen.add(id)
+    return seen
+
+def purge(ids):
+    """Removes datablocks of ids without users until none is left, like a
+    recursive orphans_purge restricted to ids. Removed ones are discarded
+    from ids. Returns the number of removed datablocks.
+    """
+    count = 0
+    while True:
+        orphans = set()
+        for id in list(ids):
+            try:
+                if id.users == 0:
+                    orphans.add(id)
+            except ReferenceError:
+                ids.discard(id)
+        if not orphans:
+            break
+        ids -= orphans
+        bpy.data.batch_remove(orphans)
+        count += len(orphans)
+    return count
+
 def validate_properties(dictionary):
     return all([std.rgetattr(bpy, attribute) == value for attribute, value in dictionary.items()])
@@ -2,7 +2,9 @@
 import bpy
 import bmesh
 import mathutils
+import numpy
 
+from . import mesh
 from . import meta
 
 #CREDIT: https://blender.stackexchange.com/a/159540
@@ -33,16 +35,115 @@ def apply_transform(ob, loc=False, rot=False, sca=False):
     ob.matrix_basis = basis[0] @ basis[1] @ basis[2]
     return None
 
+def join(target, sources, remove_doubles=False, normals=False):
+    """Joins mesh sources into target in world space.
+
+    Merging vertices still needs a BMesh, everything else is joined on
+    arrays. Sources are placed by their basis matrix, matrix_world is only
+    evaluated for objects linked to a scene and they usually are not.
+    """
+    if remove_doubles:
+        return join_bmesh(target, sources, remove_doubles=remove_doubles, normals=normals)
+    return join_arrays(target, sources, normals=normals)
+
+def join_arrays(target, sources, normals=False):
+    """Concatenates vertex, loop and polygon arrays and writes them once."""
+    blmeshes = [(target.data, None, None)]
+    blmeshes.extend((blob.data, blob.matrix_basis, blob) for blob in sources if blob.type == 'MESH')
+
+    vertices = []
+    loops = []
+    starts = []
+    totals = []
+    indices = []
+    smooths = []
+    corners = []
+    vertex_offset = 0
+    loop_offset = 0
+    for blmesh, matrix, blob in blmeshes:
+        _vertices = numpy.empty(len(blmesh.vertices) * 3, dtype=numpy.float32)
+        blmesh.vertices.foreach_get("co", _vertices)
+        _vertices = _vertices.reshape(-1, 3)
+        _loops = numpy.empty(len(blmesh.loops), dtype=numpy.int32)
+        blmesh.loops.foreach_get("vertex_index", _loops)
+        _starts = numpy.empty(len(blmesh.polygons), dtype=numpy.int32)
+        blmesh.polygons.foreach_get("loop_start", _starts)
+        _totals = numpy.empty(len(blmesh.polygons), dtype=numpy.int32)
+        blmesh.polygons.foreach_get("loop_total", _totals)
+        _indices = numpy.empty(len(blmesh.polygons), dtype=numpy.int32)
+        blmesh.polygons.foreach_get("material_index", _indices)
+        _smooths = numpy.empty(len(blmesh.polygons), dtype=bool)
+        blmesh.polygons.foreach_get("use_smooth", _smooths)
+
+        if matrix is not None:
+            _matrix = numpy.array(matrix, dtype=numpy.float64)
+            _vertices = (_vertices @ _matrix[:3, :3].T + _matrix[:3, 3]).astype(numpy.float32)
+            _indices = mimic_indices(blob, target, _indices)
+        if normals:
+            corners.append(mesh.corner_normals(blmesh, matrix))
+
+        vertices.append(_vertices)
+        loops.append(_loops + vertex_offset)
+        starts.append(_starts + loop_offset)
+        totals.append(_totals)
+        indices.append(_indices)
+        smooths.append(_smooths)
+        vertex_offset += len(_vertices)
+        loop_offset += len(_loops)
+
+    bldata = target.data
+    bldata.clear_geometry()
+    mesh.from_arrays(
+        bldata,
+        numpy.concatenate(vertices),
+        numpy.concatenate(loops),
+        numpy.concatenate(starts),
+        numpy.concatenate(totals),
+    )
+    bldata.polygons.foreach_set("material_index", numpy.concatenate(indices))
+    # NOTE: Like the BMesh join, every polygon keeps its own shading.
+    bldata.polygons.foreach_set("use_smooth", numpy.concatenate(smooths))
+
+    if normals:
+        mesh.set_normals(bldata, numpy.concatenate(corners))
+    else:
+        bldata.set_sharp_from_angle(angle=0.6)
+    return None
+
+def mimic_indices(source, target, indices):
+    """Returns material indices of source polygons remapped to target slots."""
+    s_slots = source.material_slots
+    if not s_slots:
+        return numpy.zeros_like(indices)
+
+    materials = target.data.materials
+    table = numpy.zeros(len(s_slots), dtype=numpy.int32)
+    for i, slot in enumerate(s_slots):
+        mat = slot.material
+        if mat is None:
+            continue
+        index = materials.find(mat.name)
+        if index == -1:
+            materials.append(mat)
+            index = len(materials) - 1
+        table[i] = index
+    return table[numpy.clip(indices, 0, len(table) - 1)]
+
 #CREDIT: https://blenderartists.org/t/joining-objects-in-edit-mode/1158066/2
-def join(target, sources, remove_doubles=False):
+def join_bmesh(target, sources, remove_doubles=False, normals=False):
+    # NOTE: Loops keep their order through the BMesh, so corner normals of
+    ## target and sources can be carried over as custom normals.
+    corners = [mesh.corner_normals(target.data)] if normals else None
     new = bmesh.new()
     new.from_mesh(target.data)
     temp = bpy.data.meshes.new("temp")
     for blob in sources:
         if blob.type == 'MESH':
+            if normals:
+                corners.append(mesh.corner_normals(blob.data, blob.matrix_basis))
             _bmesh = bmesh.new()
             _bmesh.from_mesh(blob.data,  face_normals=True)
-            _bmesh.transform(blob.matrix_world)
+            _bmesh.transform(blob.matrix_basis)
             _bmesh.to_mesh(temp)
             _bmesh.free()
             mimic_materials(blob, target, temp)
@@ -53,32 +154,25 @@ def join(target, sources, remove_doubles=False):
     new.to_mesh(target.data)
     new.free()
 
-    target.data.set_sharp_from_angle(angle=0.6)
+    if normals and not remove_doubles:
+        mesh.set_normals(target.data, numpy.concatenate(corners))
+    else:
+        target.data.set_sharp_from_angle(angle=0.6)
     return None
 
-#CREDIT: https://blenderartists.org/t/joining-objects-in-edit-mode/1158066/2
 def mimic_materials(source, target, temp):
-    s_slots = source.material_slots
-    t_slots = target.material_slots
-
-    if not s_slots:
-         return None
-
-    matlist = [s_slots[face.material_index].material for face in source.data.polygons]
-    # Eliminates namespace lookups == faster loops
-    append = target.data.materials.append
-    find = target.material_slots.find
-
-    # Add source material to target if it doesn't exist
-    for slot in s_slots:
-        mat = slot.material
-        if mat is not None:
-            if mat.name not in t_slots:
-                append(mat)
+    """Remaps material indices of temp, a copy of source, to target slots."""
+    indices = numpy.empty(len(temp.polygons), dtype=numpy.int32)
+    temp.polygons.foreach_get("material_index", indices)
+    temp.polygons.foreach_set("material_index", mimic_indices(source, target, indices))
+    return None
 
-    # assign the correct material index to faces in temp mesh
-    for p, mat in zip(temp.polygons, matlist):
-        p.material_index = find(mat.name)
+def set_matrices(blobs, matrices):
+    """Writes (N, 4, 4) row major world matrices to objects."""
+    # NOTE: foreach_set only works on a collection holding exactly these
+    ## objects, linking them into a throwaway one costs more than it saves.
+    for blob, matrix in zip(blobs, matrices.tolist()):
+        blob.matrix_world = mathutils.Matrix(matrix)
     return None
 
 def obt(name, data=None, local=False, force=False, overwrite=None, parent=None, hollow=True):